@@ -0,0 +1,91 @@
+"""
+Compares converting synthetic source issues field by field through
+YouTrackImporter.process_field with the compiled ImportPlan used by _to_yt_issue.
+Target YouTrack is replaced by an in-memory stub, so only conversion is measured.
+
+Usage: python benchmarks/import_plan.py [number of issues]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import youtrack
+from youtrack.youtrackImporter import YouTrackImporter, YouTrackImportConfig, ImportPlan
+
+PROJECT_ID = 'BENCH'
+
+
+class _Target(object):
+    def getProjectCustomFields(self, project_id):
+        fields = []
+        for name, field_type in (('Priority', 'enum[1]'), ('Type', 'enum[1]'), ('Fix versions', 'version[*]'),
+                                 ('Assignee', 'user[1]')):
+            pcf = youtrack.ProjectCustomField()
+            pcf.name = name
+            pcf.type = field_type
+            fields.append(pcf)
+        return fields
+
+    def getCustomFields(self):
+        return self.getProjectCustomFields(PROJECT_ID)
+
+    def getProjectTimeTrackingSettings(self, project_id):
+        return None
+
+
+class _Importer(YouTrackImporter):
+    def _to_yt_user(self, value):
+        user = youtrack.User()
+        user.login = value
+        user.getGroups = lambda: []
+        return user
+
+    def _import_user(self, user):
+        pass
+
+
+def _issues(count):
+    for i in range(count):
+        yield {'id': i + 1,
+               'title': 'Summary of issue %d' % i,
+               'body': 'Description of issue %d' % i,
+               'priority': ['p1', 'p2', 'p3'][i % 3],
+               'kind': 'bug' if i % 2 else 'feature',
+               'fix': ['1.0', '2.0'],
+               'owner': 'user%d' % (i % 50),
+               'author': 'user%d' % (i % 70),
+               'ignored': 'x'}
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    config = YouTrackImportConfig({'id': 'numberInProject', 'title': 'summary', 'body': 'description',
+                                   'priority': 'Priority', 'kind': 'Type', 'fix': 'Fix versions',
+                                   'owner': 'Assignee', 'author': 'reporterName'},
+                                  {},
+                                  {'Priority': {'p1': 'Critical', 'p2': 'Major', 'p3': 'Normal'}})
+    importer = _Importer(None, _Target(), config)
+    issues = list(_issues(count))
+
+    start = time.time()
+    for issue in issues:
+        result = youtrack.Issue()
+        for (key, value) in list(issue.items()):
+            importer.process_field(key, PROJECT_ID, result, value)
+    field_by_field = time.time() - start
+
+    plan = ImportPlan(importer, PROJECT_ID)
+    start = time.time()
+    for issue in issues:
+        plan.convert(issue, youtrack.Issue())
+    compiled = time.time() - start
+
+    print('%d issues' % count)
+    print('process_field: %.2f s (%.1f us/issue)' % (field_by_field, 1e6 * field_by_field / count))
+    print('ImportPlan:    %.2f s (%.1f us/issue)' % (compiled, 1e6 * compiled / count))
+
+
+if __name__ == '__main__':
+    main()
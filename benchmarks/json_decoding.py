@@ -0,0 +1,90 @@
+"""
+Compares decoding a page of issues from XML with minidom into Issue objects, as
+Connection.getIssues does, with decoding the same issues from JSON through jsonMapping,
+with the fast decoder (when one is installed) and with json.
+
+Usage: python benchmarks/json_decoding.py [number of issues]
+"""
+import json
+import os
+import sys
+import time
+from xml.dom import Node
+from xml.dom import minidom
+from xml.sax.saxutils import escape, quoteattr
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import youtrack
+from youtrack import jsonMapping
+
+
+def _issue_fields(i):
+    return [('projectShortName', ['BENCH']),
+            ('numberInProject', [str(i)]),
+            ('summary', ['Summary of issue %d' % i]),
+            ('description', ['Description of issue %d, ' % i * 10]),
+            ('created', ['1400000000000']),
+            ('updated', ['1400000100000']),
+            ('reporterName', ['user%d' % (i % 70)]),
+            ('Priority', [['Critical', 'Major', 'Normal'][i % 3]]),
+            ('Type', ['Bug' if i % 2 else 'Feature']),
+            ('State', ['Open']),
+            ('Assignee', ['user%d' % (i % 50)]),
+            ('Fix versions', ['1.0', '2.0'])]
+
+
+def _xml(count):
+    parts = ['<issueCompacts>']
+    for i in range(count):
+        parts.append('<issue id="BENCH-%d">' % i)
+        for name, values in _issue_fields(i):
+            parts.append('<field name=%s>' % quoteattr(name))
+            parts.extend(['<value>%s</value>' % escape(value) for value in values])
+            parts.append('</field>')
+        parts.append('</issue>')
+    parts.append('</issueCompacts>')
+    return ''.join(parts).encode('utf-8')
+
+
+def _json(count):
+    return json.dumps({'issue': [{'id': 'BENCH-%d' % i,
+                                  'field': [{'name': name, 'value': values if len(values) > 1 else values[0]}
+                                            for name, values in _issue_fields(i)]}
+                                 for i in range(count)]}).encode('utf-8')
+
+
+def _decode_xml(content):
+    xml = minidom.parseString(content)
+    return [youtrack.Issue(e, None) for e in xml.documentElement.childNodes if e.nodeType == Node.ELEMENT_NODE]
+
+
+def _decode_json(content):
+    return jsonMapping.to_issues(jsonMapping.loads(content))
+
+
+def _measure(name, decode, content, count):
+    start = time.time()
+    issues = decode(content)
+    spent = time.time() - start
+    assert len(issues) == count
+    print('%-24s %.2f s (%.1f us/issue)' % (name + ':', spent, 1e6 * spent / count))
+    return issues
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    xml_content = _xml(count)
+    json_content = _json(count)
+    print('%d issues, XML %d KB, JSON %d KB' % (count, len(xml_content) // 1024, len(json_content) // 1024))
+    from_xml = _measure('XML (minidom)', _decode_xml, xml_content, count)
+    jsonMapping.use_fast_decoder = False
+    from_json = _measure('JSON (json)', _decode_json, json_content, count)
+    jsonMapping.use_fast_decoder = True
+    if jsonMapping.get_decoder_name() != 'json':
+        _measure('JSON (%s)' % jsonMapping.get_decoder_name(), _decode_json, json_content, count)
+    assert from_xml[1].summary == from_json[1].summary and from_xml[1]['Fix versions'] == from_json[1]['Fix versions']
+
+
+if __name__ == '__main__':
+    main()
@@ -48,6 +48,13 @@ class XmlException(Exception):
         Exception.__init__(self, msg)
 
 
+class FieldNotLoadedError(AttributeError):
+    """
+    Raised on access to a field of an issue that has been requested without it.
+    """
+    pass
+
+
 class YouTrackException(Exception):
     def __init__(self, url, response, content):
         self.response = response
@@ -133,7 +140,7 @@ class YouTrackObject(object):
     def __repr__(self):
         _repr = ''
         for k, v in list(self.__dict__.items()):
-            if k in ('youtrack', '_attribute_types'):
+            if k in ('youtrack', '_attribute_types', '_loaded_fields'):
                 continue
             _repr += '{0}={1}\n'.format(k,v)
         return _repr
@@ -147,6 +154,10 @@ class YouTrackObject(object):
             #print('Failed to remove key. {0}'.format(e))
         try:
             del data['_attribute_types']
+        except KeyError as e:
+            pass
+        try:
+            del data['_loaded_fields']
         except KeyError as e:
             pass
             #print('Failed to remove key. {0}'.format(e))
@@ -154,7 +165,7 @@ class YouTrackObject(object):
 
     def __iter__(self):
         for item in self.__dict__:
-            if item == '_attribute_types':
+            if item in ('_attribute_types', '_loaded_fields'):
                 continue
             attr = self.__dict__[item]
             if isinstance(attr, str) or isinstance(attr, list) \
@@ -180,7 +191,9 @@ class YouTrackError(YouTrackObject):
 
 
 class Issue(YouTrackObject):
-    def __init__(self, xml=None, youtrack=None):
+    def __init__(self, xml=None, youtrack=None, loaded_fields=None):
+        # names of requested fields, None when the issue has been loaded with all fields
+        self._loaded_fields = set(loaded_fields) | set(['id']) if loaded_fields is not None else None
         YouTrackObject.__init__(self, xml, youtrack)
         if xml is not None:
             if len(xml.getElementsByTagName('links')) > 0:
@@ -199,6 +212,19 @@ class Issue(YouTrackObject):
             if hasattr(self, 'fixedInBuild') and (self.fixedInBuild == 'Next build'):
                 self.fixedInBuild = None
 
+    def __getattr__(self, name):
+        # called only for attributes that are not set
+        loaded_fields = self.__dict__.get('_loaded_fields')
+        if loaded_fields is not None and name not in loaded_fields and not name.startswith('_'):
+            raise FieldNotLoadedError("Field '%s' of issue has not been loaded" % name)
+        raise AttributeError(name)
+
+    def isLoaded(self, name):
+        """ False when the issue has been requested without field name, so its absence says nothing
+            about its value.
+        """
+        return self._loaded_fields is None or name in self._loaded_fields
+
     def _normilizeMultiple(self, name):
         if hasattr(self, name):
             attrValue = self[name]
@@ -297,9 +323,7 @@ class IssueChange(YouTrackObject):
         for field in xml.getElementsByTagName('field'):
             name = field.getAttribute('name')
             if name == 'updated':
-                #self.updated = int(self._text(field.getElementsByTagName('value')[0]))
-                #Parse to datetime
-                self.updated = datetime.utcfromtimestamp(self._text(field.getElementsByTagName('value')[0]))
+                self.updated = int(self._text(field.getElementsByTagName('value')[0]))
             elif name == 'updaterName':
                 self.updater_name = self._text(field.getElementsByTagName('value')[0])
             elif name == 'links':
@@ -310,6 +334,17 @@ class IssueChange(YouTrackObject):
         for comment in xml.getElementsByTagName('comment'):
             self.comments.append(comment.getAttribute('text'))
 
+    @staticmethod
+    def get_updated(xml):
+        """
+        Returns time of change xml in milliseconds without parsing the whole change.
+        """
+        for field in xml.getElementsByTagName('field'):
+            if field.getAttribute('name') == 'updated':
+                values = field.getElementsByTagName('value')
+                return int("".join([e.data for e in values[0].childNodes if e.nodeType == Node.TEXT_NODE]))
+        return 0
+
 
 class ChangeField(YouTrackObject):
     def __init__(self, xml=None, youtrack=None):
@@ -319,6 +354,8 @@ class ChangeField(YouTrackObject):
         YouTrackObject.__init__(self, xml, youtrack)
 
     def _update(self, xml):
+        if xml is None:
+            return
         self.name = xml.getAttribute('name')
         old_value = xml.getElementsByTagName('oldValue')
         for value in old_value:
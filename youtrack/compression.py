@@ -0,0 +1,117 @@
+"""
+Gzip support of Connection: compression of request bodies, streaming decompression of
+responses and counters of transferred bytes.
+"""
+
+import gzip
+import threading
+import zlib
+
+# request bodies smaller than this are sent as is
+MIN_COMPRESSED_SIZE = 1024
+
+
+# parts of error messages of servers failing to read a gzipped body, e.g. ZipException of Java
+_DECODING_ERRORS = (b'gzip', b'content-encoding', b'decompress', b'decoding', b'unexpected end of zlib')
+
+
+def is_compression_rejected(response, content):
+    """
+    Tells whether a response to a gzipped request says that the server can't read the body.
+    """
+    if response.status == 415:
+        return True
+    if response.status not in (400, 500) or not content:
+        return False
+    content = content.lower()
+    return any(error in content for error in _DECODING_ERRORS)
+
+
+def gzip_body(body):
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return gzip.compress(body, 6)
+
+
+class TransferStats(object):
+    """
+    Counters of requests and bytes sent and received by a connection. bytes_sent counts request
+    bodies as sent, body_bytes counts them before compression, so the difference is the traffic
+    saved by compressing. httplib2 decompresses responses itself, so bytes_received counts
+    decoded response bodies and compressed_responses only tells how many were compressed.
+    """
+
+    _counters = ('requests', 'compressed_requests', 'body_bytes', 'bytes_sent', 'compressed_responses',
+                 'bytes_received')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            for name in self._counters:
+                setattr(self, name, 0)
+
+    def add(self, **counters):
+        with self._lock:
+            for (name, value) in list(counters.items()):
+                setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self):
+        with self._lock:
+            return dict([(name, getattr(self, name)) for name in self._counters])
+
+    def __repr__(self):
+        return ', '.join(['%s=%d' % item for item in list(self.as_dict().items())])
+
+
+class GzipStream(object):
+    """
+    File-like object decompressing a gzip encoded response while it is read. Other attributes
+    are taken from the response, headers have Content-Encoding and Content-Length removed,
+    because they describe the compressed body.
+    """
+
+    def __init__(self, response, stats=None, chunk_size=64 * 1024):
+        self._response = response
+        self._stats = stats
+        self._chunk_size = chunk_size
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._buffer = b''
+        self._eof = False
+        self.headers = response.headers.__class__()
+        for (name, value) in list(response.headers.items()):
+            if name.lower() not in ('content-encoding', 'content-length'):
+                self.headers[name] = value
+
+    def info(self):
+        return self.headers
+
+    def read(self, size=-1):
+        while not self._eof and (size is None or size < 0 or len(self._buffer) < size):
+            data = self._response.read(self._chunk_size)
+            if data:
+                self._buffer += self._decompressor.decompress(data)
+            else:
+                self._buffer += self._decompressor.flush()
+                self._eof = True
+        if size is None or size < 0:
+            result, self._buffer = self._buffer, b''
+        else:
+            result, self._buffer = self._buffer[:size], self._buffer[size:]
+        if self._stats is not None:
+            self._stats.add(bytes_received=len(result))
+        return result
+
+    def close(self):
+        self._response.close()
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
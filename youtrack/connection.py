@@ -1,17 +1,29 @@
 import calendar
 import functools
-import httplib2
 import json
 import re
+import shutil
 import sys
 import tempfile
+import threading
 import time
 import urllib.request, urllib.parse, urllib.error
+import uuid
 from xml.dom import Node
 from xml.dom import minidom
 from xml.sax.saxutils import escape, quoteattr
+from xml.etree import ElementTree
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 import youtrack
+from youtrack import compression
+from youtrack import jsonMapping
+from youtrack.importXml import IssuesXmlWriter
+from youtrack.transport import Httplib2Transport, Response
+
+# multipart bodies of attachments larger than this are written to disk before sending
+ATTACHMENT_SPOOL_SIZE = 1024 * 1024
+
 
 def relogin_on_401(f):
     @functools.wraps(f)
@@ -35,12 +47,20 @@ def relogin_on_401(f):
 
 
 class Connection(object):
-    def __init__(self, url, login=None, password=None, proxy_info=None, token=None):
-        if proxy_info is None:
-            self.http = httplib2.Http(disable_ssl_certificate_validation=True)
-        else:
-            self.http = httplib2.Http(disable_ssl_certificate_validation=True,
-                                      proxy_info=proxy_info)
+    def __init__(self, url, login=None, password=None, proxy_info=None, token=None, transport=None):
+        # see youtrack.transport, proxy_info is used by the default transport only
+        self.transport = transport if transport is not None else Httplib2Transport(proxy_info)
+        # seconds a number of issues for a filter is reused
+        self.count_cache_ttl = 30
+        self._count_cache = dict()
+        self._count_lock = threading.Lock()
+        self._count_executor = None
+        # issues and comments are requested as JSON instead of XML
+        self.prefer_json = False
+        # bodies of import requests are sent gzipped, until the server rejects them
+        self.compress_requests = False
+        self._compression_rejected = False
+        self.stats = compression.TransferStats()
 
         self.url = url.rstrip('/')
         self.baseUrl = self.url + "/api"
@@ -52,6 +72,11 @@ class Connection(object):
         elif login:
             self._login(login, password)
 
+    @property
+    def http(self):
+        # httplib2.Http of the current thread, there is one with the default transport only
+        return self.transport.http
+
     def set_auth_token(self, token):
         if token:
             self.headers = {'Authorization': 'Bearer ' + token}
@@ -62,13 +87,13 @@ class Connection(object):
         if password is None:
             password = ''
         body = 'login=%s&password=%s' % (urllib.parse.quote(login), urllib.parse.quote(password))
-        response, content = self.http.request(
-            uri=self.baseUrl + '/user/login',
-            method='POST',
-            body=body,
+        response, content = self.transport.request(
+            self.baseUrl + '/user/login',
+            'POST',
             headers={'Connection': 'keep-alive',
                      'Content-Type': 'application/x-www-form-urlencoded',
-                     'Content-Length': str(len(body))}
+                     'Content-Length': str(len(body))},
+            body=body
         )
         if response.status != 200:
             raise youtrack.YouTrackException('/user/login', response, content)
@@ -104,18 +129,19 @@ class Connection(object):
             headers = headers.copy()
             headers['Accept'] = content_type
 
-        if url.startswith('http'):
-            response, content = self.http.request(
-                url,
-                method,
-                headers=headers,
-                body=body)
+        if body and (method == 'PUT' or method == 'POST') and self._should_compress(url, body):
+            compressed_body = compression.gzip_body(body)
+            headers['Content-Encoding'] = 'gzip'
+            headers['Content-Length'] = str(len(compressed_body))
+            response, content = self._send(method, url, headers, compressed_body, len(body))
+            if compression.is_compression_rejected(response, content):
+                # the server can't read compressed bodies, so they are not sent any more
+                self._compression_rejected = True
+                del headers['Content-Encoding']
+                headers['Content-Length'] = str(len(body))
+                response, content = self._send(method, url, headers, body)
         else:
-            response, content = self.http.request(
-                (self.baseUrl + url),
-                method,
-                headers=headers,
-                body=body)
+            response, content = self._send(method, url, headers, body)
 
         #if response.get('content-type', '').lower().find('/xml') != -1:
         #    # Remove invalid xml/utf-8 data
@@ -131,6 +157,39 @@ class Connection(object):
 
         return response, content
 
+    def _send(self, method, url, headers, body, body_length=None):
+        if url.startswith('http'):
+            response, content = self.transport.request(
+                url,
+                method,
+                headers=headers,
+                body=body)
+        else:
+            response, content = self.transport.request(
+                (self.baseUrl + url),
+                method,
+                headers=headers,
+                body=body)
+        sent = len(body) if body else 0
+        self.stats.add(requests=1,
+                       bytes_sent=sent,
+                       body_bytes=body_length if body_length is not None else sent,
+                       compressed_requests=1 if body_length is not None else 0,
+                       # transports keep the original encoding there after decompressing
+                       compressed_responses=1 if '-content-encoding' in response else 0,
+                       bytes_received=len(content) if content else 0)
+        return response, content
+
+    def setCompressRequests(self, on):
+        """ Sends bodies of import requests gzipped. If the server rejects a compressed body, the request
+            is repeated uncompressed and compression is not used any more.
+        """
+        self.compress_requests = on
+
+    def _should_compress(self, url, body):
+        return self.compress_requests and not self._compression_rejected and \
+               url.startswith('/import/') and len(body) >= compression.MIN_COMPRESSED_SIZE
+
     def _reqXml(self, method, url, body=None, ignoreStatus=None):
         response, content = self._req(
             method, url, body, ignoreStatus, "application/xml")
@@ -153,6 +212,13 @@ class Connection(object):
         else:
             return content
 
+    def setPreferJson(self, on):
+        self.prefer_json = on
+
+    def _getJson(self, url):
+        response, content = self._req('GET', url, content_type='application/json')
+        return jsonMapping.loads(content)
+
     def _getXml(self, url):
         response, content = self._req('GET', url)
         if content is None or content == '':
@@ -171,6 +237,8 @@ class Connection(object):
         return self._reqXml('PUT', url, '<empty/>\n\n')
 
     def getIssue(self, id):
+        if self.prefer_json:
+            return jsonMapping.to_issue(self._getJson("/issue/" + id), self)
         return youtrack.Issue(self._get("/issue/" + id), self)
 
     def createIssue(self, project, assignee, summary, description, priority=None, type=None, subsystem=None, state=None,
@@ -204,11 +272,17 @@ class Connection(object):
     def deleteIssue(self, issue_id):
         return self._req('DELETE', '/issue/%s' % issue_id)
 
-    def get_changes_for_issue(self, issue):
-        return [youtrack.IssueChange(change, self) for change in
-                self._get("/issue/%s/changes" % issue).getElementsByTagName('change')]
+    def get_changes_for_issue(self, issue, after=None):
+        """ Returns changes of issue, if after (in milliseconds) is given, only changes made later
+        """
+        changes = self._get("/issue/%s/changes" % issue).getElementsByTagName('change')
+        if after is not None:
+            changes = [change for change in changes if youtrack.IssueChange.get_updated(change) > after]
+        return [youtrack.IssueChange(change, self) for change in changes]
 
     def getComments(self, id):
+        if self.prefer_json:
+            return jsonMapping.to_objects(youtrack.Comment, self._getJson('/issue/' + id + '/comment'), self, 'comment')
         xml = self._getXml('/issue/' + id + '/comment')
         return [youtrack.Comment(e, self) for e in xml.documentElement.childNodes if e.nodeType == Node.ELEMENT_NODE]
 
@@ -217,7 +291,28 @@ class Connection(object):
         return [youtrack.Attachment(e, self) for e in xml.documentElement.childNodes if e.nodeType == Node.ELEMENT_NODE]
 
     def getAttachmentContent(self, url):
-        f = urllib.request.urlopen(urllib.request.Request(self.url + url, headers=self.headers))
+        if isinstance(url, bytes):
+            url = url.decode('utf-8')
+        return self._open(self.url + url)
+
+    @relogin_on_401
+    def _open(self, url, accept=None):
+        """ Opens a stream reading the response to GET url, a gzipped response is decompressed
+            while it is read.
+        """
+        headers = self.headers.copy()
+        if accept is not None:
+            headers['Accept'] = accept
+        headers['Accept-Encoding'] = 'gzip'
+        try:
+            f = self.transport.open(url, headers)
+        except urllib.error.HTTPError as e:
+            # the default transport opens streams with urllib
+            raise youtrack.YouTrackException(url, Response(e), e.read())
+        self.stats.add(requests=1)
+        if f.headers.get('Content-Encoding', '').lower() == 'gzip':
+            self.stats.add(compressed_responses=1)
+            return compression.GzipStream(f, self.stats)
         return f
 
     def deleteAttachment(self, issue_id, attachment_id):
@@ -227,8 +322,8 @@ class Connection(object):
         try:
             content = a.getContent()
             contentLength = None
-            if 'content-length' in content.headers.dict:
-                contentLength = int(content.headers.dict['content-length'])
+            if content.headers.get('content-length') is not None:
+                contentLength = int(content.headers.get('content-length'))
             print('Importing attachment for issue ', issueId)
             try:
                 print('Name: ', a.name)
@@ -240,9 +335,16 @@ class Connection(object):
                 print(e)
             return self.importAttachment(issueId, a.name, content, a.authorLogin,
                 contentLength=contentLength,
-                contentType=content.info().type,
+                contentType=content.info().get_content_type(),
                 created=a.created if hasattr(a, 'created') else None,
                 group=a.group if hasattr(a, 'group') else '')
+        except youtrack.YouTrackException as e:
+            print("Can't create attachment")
+            print("HTTP CODE: ", e.response.status)
+            print("REASON: ", e.content)
+            print("IssueId: ", issueId)
+            print("Attachment filename: ", a.name)
+            print("Attachment URL: ", a.url)
         except urllib.error.HTTPError as e:
             print("Can't create attachment")
             try:
@@ -277,21 +379,26 @@ class Connection(object):
 
     def _process_attachments(self, authorLogin, content, contentLength, contentType, created, group, issueId, name,
                              url_prefix='/issue/'):
-        if contentType is not None:
-            content.contentType = contentType
-        if contentLength is not None:
-            content.contentLength = contentLength
-        elif not isinstance(content, file):
-            tmp = tempfile.NamedTemporaryFile(mode='w+b')
-            tmp.write(content.read())
-            tmp.flush()
-            tmp.seek(0)
-            content = tmp
-
-        #post_data = {'attachment': content}
-        post_data = {name: content}
+        boundary = uuid.uuid4().hex
+        # the body is put together in a temporary file that is kept in memory while it is small,
+        # so a large attachment is neither read whole nor copied into the body in memory
+        body = tempfile.SpooledTemporaryFile(ATTACHMENT_SPOOL_SIZE)
+        if contentLength is not None and contentLength > ATTACHMENT_SPOOL_SIZE:
+            body.rollover()
+        body.write(('--%s\r\nContent-Disposition: form-data; name=%s; filename=%s\r\n'
+                    'Content-Type: %s\r\n\r\n' %
+                    (boundary, quoteattr(name), quoteattr(name),
+                     contentType or 'application/octet-stream')).encode('utf-8'))
+        if isinstance(content, bytes):
+            body.write(content)
+        else:
+            shutil.copyfileobj(content, body)
+        body.write(('\r\n--%s--\r\n' % boundary).encode('utf-8'))
+        body_length = body.tell()
+        body.seek(0)
         headers = self.headers.copy()
-        #headers['Content-Type'] = contentType
+        headers['Content-Type'] = 'multipart/form-data; boundary=' + boundary
+        headers['Content-Length'] = str(body_length)
         # name without extension to workaround: http://youtrack.jetbrains.net/issue/JT-6110
         params = {#'name': os.path.splitext(name)[0],
                   'authorLogin': authorLogin.encode('utf-8'),
@@ -304,19 +411,20 @@ class Connection(object):
             try:
                 params['created'] = self.getIssue(issueId).created
             except youtrack.YouTrackException:
-                params['created'] = str(calendar.timegm(datetime.now().timetuple()) * 1000)
+                params['created'] = str(calendar.timegm(datetime.datetime.now().timetuple()) * 1000)
 
         url = self.baseUrl + url_prefix + issueId + "/attachment?" + urllib.parse.urlencode(params)
-        r = urllib.request.Request(url,
-            headers=headers, data=post_data)
-        #r.set_proxy('localhost:8888', 'http')
         try:
-            res = urllib.request.urlopen(r)
-        except urllib.error.HTTPError as e:
-            if e.code == 201:
-                return e.msg + ' ' + name
-            raise e
-        return res
+            response, result = self.transport.request(url, 'POST', headers=headers, body=body)
+        finally:
+            body.close()
+        self.stats.add(requests=1, bytes_sent=body_length, body_bytes=body_length,
+                       bytes_received=len(result) if result else 0)
+        if response.status not in (200, 201):
+            raise youtrack.YouTrackException(url, response, result)
+        if response.status == 201:
+            return response.reason + ' ' + name
+        return result
 
     def createAttachment(self, issueId, name, content, authorLogin='', contentType=None, contentLength=None,
                          created=None, group=''):
@@ -411,17 +519,7 @@ class Connection(object):
         if len(issues) <= 0:
             return
 
-        bad_fields = ['id', 'projectShortName', 'votes', 'commentsCount',
-                      'historyUpdated', 'updatedByFullName', 'updaterFullName',
-                      'reporterFullName', 'links', 'attachments', 'jiraId',
-                      'entityId', 'tags', 'sprint', 'wikified']
-
-        tt_settings = self.getProjectTimeTrackingSettings(projectId)
-        if tt_settings and tt_settings.Enabled and tt_settings.TimeSpentField:
-            bad_fields.append(tt_settings.TimeSpentField)
-
-        if not self.isMarkdownSupported():
-            bad_fields.append('markdown')
+        bad_fields = self.getIssueImportBadFields(projectId)
 
         xml = '<issues>\n'
         issue_records = dict([])
@@ -521,6 +619,51 @@ class Connection(object):
                 print("")
         return response
 
+    def getIssueImportBadFields(self, projectId):
+        """ Names of fields that are skipped when issues are imported to the project
+        """
+        bad_fields = ['id', 'projectShortName', 'votes', 'commentsCount',
+                      'historyUpdated', 'updatedByFullName', 'updaterFullName',
+                      'reporterFullName', 'links', 'attachments', 'jiraId',
+                      'entityId', 'tags', 'sprint', 'wikified']
+
+        tt_settings = self.getProjectTimeTrackingSettings(projectId)
+        if tt_settings and tt_settings.Enabled and tt_settings.TimeSpentField:
+            bad_fields.append(tt_settings.TimeSpentField)
+
+        if not self.isMarkdownSupported():
+            bad_fields.append('markdown')
+        return bad_fields
+
+    def createIssuesXmlWriter(self, projectId, bad_fields=None):
+        """ Returns IssuesXmlWriter to pass to importIssuesFromWriter
+        """
+        if bad_fields is None:
+            bad_fields = self.getIssueImportBadFields(projectId)
+        return IssuesXmlWriter(bad_fields)
+
+    def importIssuesFromWriter(self, projectId, assigneeGroup, writer):
+        """ Imports issues written by IssuesXmlWriter, returns import result
+        """
+        if not len(writer):
+            return
+        url = '/import/' + urllib.parse.quote(projectId) + '/issues?' + \
+              urllib.parse.urlencode({'assigneeGroup': assigneeGroup})
+        result = self._reqXml('PUT', url, writer.toxml(), 400)
+        if not hasattr(result, 'toxml'):
+            sys.stderr.write("can't parse response\n")
+            return result
+        for item in result.getElementsByTagName("item"):
+            id = item.getAttribute("id")
+            if item.getAttribute("imported").lower() == "true":
+                print("Issue [ %s-%s ] imported successfully" % (projectId, id))
+            else:
+                sys.stderr.write("Failed to import issue [ %s-%s ].\n" % (projectId, id))
+                sys.stderr.write("Reason : " + item.toxml() + "\n")
+                if id in writer:
+                    sys.stderr.write("Request was :" + writer.get_record(id) + "\n")
+        return result.toxml()
+
     def getProjects(self):
         projects = {}
         for e in self._get("/project/all").documentElement.childNodes:
@@ -741,7 +884,21 @@ class Connection(object):
             '/admin/project/' + urllib.parse.quote(projectId) + '/version/' + urllib.parse.quote(name.encode('utf-8')) + "?" +
             urllib.parse.urlencode(params))
 
-    def getIssues(self, projectId, filter, after, max):
+    def getIssues(self, projectId, filter, after, max, withFields=()):
+        """ With withFields only the listed fields of issues are requested, the issues know
+            which fields they have been loaded with (see Issue.isLoaded).
+        """
+        if len(withFields):
+            # only /issue supports projection, the project goes to the filter then
+            url = '/issue?' + urllib.parse.urlencode([('with', field) for field in withFields] +
+                                                     [('after', str(after)),
+                                                      ('max', str(max)),
+                                                      ('filter', self._project_filter(projectId, filter))])
+            if self.prefer_json:
+                return jsonMapping.to_issues(self._getJson(url), self, withFields)
+            xml = self._getXml(url)
+            return [youtrack.Issue(e, self, withFields) for e in xml.documentElement.childNodes
+                    if e.nodeType == Node.ELEMENT_NODE]
         #response, content = self._req('GET', '/project/issues/' + urllib.parse.quote(projectId) + "?" +
         path = '/issue'
         if projectId:
@@ -749,23 +906,87 @@ class Connection(object):
         url = path + "?" + urllib.parse.urlencode({'after': str(after),
                                                    'max': str(max),
                                                    'filter': filter})
+        if self.prefer_json:
+            return jsonMapping.to_issues(self._getJson(url), self)
         xml = self._getXml(url)
         return [youtrack.Issue(e, self) for e in xml.documentElement.childNodes if e.nodeType == Node.ELEMENT_NODE]
 
-    def getNumberOfIssues(self, filter = '', waitForServer=True):
+    def iterIssues(self, projectId, filter='', withFields=(), batch=100):
+        """ Yields all issues of project matching filter, requesting them by pages of batch issues.
+        """
+        after = 0
         while True:
-          urlFilterList = [('filter',filter)]
-          finalUrl = '/issue/count?' + urllib.parse.urlencode(urlFilterList)
-          response, content = self._req('GET', finalUrl, content_type="application/json")
-          result = json.loads(content)
-          numberOfIssues = result['value']
-          if (not waitForServer):
-            return numberOfIssues
-          if (numberOfIssues!=-1):
-            break
-
-        time.sleep(5)
-        return self.getNumberOfIssues(filter,False)
+            issues = self.getIssues(projectId, filter, after, batch, withFields)
+            if not len(issues):
+                return
+            for issue in issues:
+                yield issue
+            after += batch
+
+    def _project_filter(self, projectId, filter):
+        filter = (filter or '').strip()
+        if not projectId:
+            return filter
+        if not filter:
+            return 'project: %s' % projectId
+        # parentheses keep "or" of the filter inside the project
+        return 'project: %s (%s)' % (projectId, filter)
+
+    _issue_id_re = re.compile(rb'<issue\s[^>]*?\bid="([^"]*)"')
+
+    def getIssueIds(self, projectId, filter, after, max):
+        """ Returns ids of issues only. Issues are requested with a minimal set of fields and ids are
+            scanned from the response without building the document, so pages can be much larger
+            than in getIssues.
+        """
+        url = '/issue?' + urllib.parse.urlencode([('with', 'numberInProject'),
+                                                  ('after', str(after)),
+                                                  ('max', str(max)),
+                                                  ('filter', self._project_filter(projectId, filter))])
+        response, content = self._req('GET', url, content_type='application/xml')
+        return [id.decode('utf-8') for id in self._issue_id_re.findall(content)]
+
+    def _requestNumberOfIssues(self, filter):
+        finalUrl = '/issue/count?' + urllib.parse.urlencode([('filter', filter)])
+        response, content = self._req('GET', finalUrl, content_type="application/json")
+        return json.loads(content)['value']
+
+    def getNumberOfIssues(self, filter = '', waitForServer=True, timeout=60):
+        """ Returns number of issues matching filter. The server answers -1 while it is still counting,
+            with waitForServer the request is repeated with growing pauses until the number is ready
+            or timeout seconds pass, -1 is returned then. Numbers are reused for count_cache_ttl seconds.
+        """
+        with self._count_lock:
+            cached = self._count_cache.get(filter)
+        if cached is not None and time.time() - cached[1] < self.count_cache_ttl:
+            return cached[0]
+        deadline = time.time() + timeout
+        delay = 0.1
+        while True:
+            numberOfIssues = self._requestNumberOfIssues(filter)
+            if numberOfIssues != -1:
+                with self._count_lock:
+                    self._count_cache[filter] = (numberOfIssues, time.time())
+                return numberOfIssues
+            if not waitForServer or time.time() + delay > deadline:
+                return numberOfIssues
+            time.sleep(delay)
+            delay = min(delay * 2, 5)
+
+    def getNumberOfIssuesAsync(self, filter = '', timeout=60):
+        """ Same as getNumberOfIssues, but returns a Future of the number at once.
+        """
+        with self._count_lock:
+            if self._count_executor is None:
+                self._count_executor = ThreadPoolExecutor(max_workers=8)
+            executor = self._count_executor
+        return executor.submit(self.getNumberOfIssues, filter, True, timeout)
+
+    def getNumbersOfIssues(self, filters, timeout=60):
+        """ Counts issues for all filters concurrently, returns dict from filter to number.
+        """
+        futures = [(filter, self.getNumberOfIssuesAsync(filter, timeout)) for filter in filters]
+        return dict([(filter, future.result()) for (filter, future) in futures])
 
 
     def getAllSprints(self,agileID):
@@ -777,13 +998,39 @@ class Connection(object):
                     [('after',str(after)),
                     ('max',str(max)),
                     ('filter',filter)]
+        if self.prefer_json:
+            return jsonMapping.to_issues(self._getJson('/issue' + "?" + urllib.parse.urlencode(urlJobby)), self,
+                                         withFields if len(withFields) else None)
         xml = self._getXml('/issue' + "?" + urllib.parse.urlencode(urlJobby))
-        return [youtrack.Issue(e, self) for e in xml.documentElement.childNodes if e.nodeType == Node.ELEMENT_NODE]
+        return [youtrack.Issue(e, self, withFields if len(withFields) else None) for e in xml.documentElement.childNodes
+                if e.nodeType == Node.ELEMENT_NODE]
 
     def exportIssueLinks(self):
         xml = self._get('/export/links')
         return [youtrack.Link(e, self) for e in xml.documentElement.childNodes if e.nodeType == Node.ELEMENT_NODE]
 
+    def iterExportedIssueLinks(self):
+        """ Same links as exportIssueLinks, but the response is parsed incrementally and links
+            are yielded one by one, so the whole document is never kept in memory.
+        """
+        f = self._open(self.baseUrl + '/export/links', 'application/xml')
+        try:
+            root = None
+            for event, element in ElementTree.iterparse(f, events=('start', 'end')):
+                if event == 'start':
+                    if root is None:
+                        root = element
+                    continue
+                if element is root:
+                    break
+                link = youtrack.Link(None, self)
+                for name, value in list(element.attrib.items()):
+                    setattr(link, name, value)
+                root.clear()
+                yield link
+        finally:
+            f.close()
+
     def executeCommand(self, issueId, command, comment=None, group=None, run_as=None, disable_notifications=False):
         if isinstance(command, str):
             command = command.encode('utf-8')
@@ -1,4 +1,10 @@
-from youtrack import YouTrackException
+from concurrent.futures import ThreadPoolExecutor
+
+from youtrack import UserBundle, YouTrackException
+
+VALUE_EXISTS = 'exists'
+VALUE_CREATED = 'created'
+VALUE_FAILED = 'failed'
 
 
 def utf8encode(source):
@@ -61,11 +67,7 @@ def create_custom_field(connection, cf_type, cf_name, auto_attached, value_names
         _create_custom_field_prototype(connection, cf_type, cf_name, auto_attached,
                 {"defaultBundle": bundle.name,
                  "attachBundlePolicy": bundle_policy})
-    for value_name in value_names:
-        try:
-            connection.addValueToBundle(bundle, value_name)
-        except YouTrackException:
-            pass
+    ensure_bundle_values(connection, bundle, value_names)
 #
 #    values_to_add = calculate_missing_value_names(bundle, value_names)
 #    [connection.addValueToBundle(bundle, name) for name in values_to_add]
@@ -126,7 +128,7 @@ def process_custom_field(connection, project_id, cf_type, cf_name, value_names=N
         values_to_add = calculate_missing_value_names(bundle, value_names)
         connection.createProjectCustomFieldDetailed(project_id, cf_name, "No " + cf_name,
                                                     params={"bundle": bundle.name})
-    [connection.addValueToBundle(bundle, bundle.createElement(name)) for name in values_to_add]
+    _raise_failed(ensure_bundle_values(connection, bundle, [bundle.createElement(name) for name in values_to_add]))
 
 
 def add_values_to_bundle_safe(connection, bundle, values):
@@ -141,15 +143,104 @@ def add_values_to_bundle_safe(connection, bundle, values):
     Raises:
         YouTrackException: if something is wrong with queries.
     """
+    _raise_failed(ensure_bundle_values(connection, bundle, values))
+
+
+class BundleValueResult(object):
+    def __init__(self, value, status, error=None):
+        self.value = value
+        self.status = status
+        self.error = error
+
+
+def get_value_key(value):
+    """
+    Returns case folded name of a bundle value, which can be a string, a bundle element or a user.
+    """
+    if isinstance(value, str):
+        name = value
+    elif hasattr(value, 'login'):
+        name = value.login
+    else:
+        name = value.name
+    return name.casefold()
+
+
+def get_bundle_value_keys(bundle):
+    if bundle.get_field_type() == 'user':
+        return set([user.login.casefold() for user in bundle.users])
+    return set([elem.name.casefold() for elem in bundle.values])
+
+
+def ensure_bundle_values(connection, bundle, values, existing_keys=None, workers=None, batch_size=20):
+    """
+    Makes sure that bundle contains all values. Only values that are missing from the bundle are created,
+    they are split into batches of batch_size values which are created concurrently. Values of enum,
+    state, version and other element bundles are shown in the order they are added, so by default
+    they are created one by one in the given order, only values of user bundles are created concurrently.
+
+    Args:
+        connection: An opened Connection instance.
+        bundle: Bundle instance to add values in.
+        values: Values that the bundle must have: names, bundle elements or users.
+        existing_keys: Set of case folded names of values the bundle already has (see get_bundle_value_keys).
+            If None, it is calculated from bundle. Keys of created values are added to it.
+        workers: Max number of concurrent requests, by default 4 for user bundles and 1 for others.
+        batch_size: Number of values created sequentially by one request thread.
+
+    Returns:
+        List of BundleValueResult, one for each distinct value.
+    """
+    if existing_keys is None:
+        existing_keys = get_bundle_value_keys(bundle)
+    results = []
+    missing = []
+    seen_keys = set([])
     for value in values:
-        try:
-            connection.addValueToBundle(bundle, value)
-        except YouTrackException as e:
-            if e.response.status == 409:
-                print("Value with name [ %s ] already exists in bundle [ %s ]" % \
-                      (utf8encode(value.name), utf8encode(bundle.name)))
-            else:
-                raise e
+        key = get_value_key(value)
+        if key in seen_keys:
+            continue
+        seen_keys.add(key)
+        if key in existing_keys:
+            results.append(BundleValueResult(value, VALUE_EXISTS))
+        else:
+            missing.append(value)
+    if not len(missing):
+        return results
+    if workers is None:
+        workers = 4 if isinstance(bundle, UserBundle) else 1
+
+    def create(batch):
+        batch_results = []
+        for value in batch:
+            try:
+                connection.addValueToBundle(bundle, value)
+                batch_results.append(BundleValueResult(value, VALUE_CREATED))
+            except YouTrackException as e:
+                if e.response.status == 409:
+                    batch_results.append(BundleValueResult(value, VALUE_EXISTS))
+                else:
+                    batch_results.append(BundleValueResult(value, VALUE_FAILED, e))
+        return batch_results
+
+    batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+    if len(batches) == 1 or workers <= 1:
+        created = [create(batch) for batch in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(batches))) as executor:
+            created = list(executor.map(create, batches))
+    for batch_results in created:
+        for result in batch_results:
+            if result.status != VALUE_FAILED:
+                existing_keys.add(get_value_key(result.value))
+            results.append(result)
+    return results
+
+
+def _raise_failed(results):
+    for result in results:
+        if result.status == VALUE_FAILED:
+            raise result.error
 
 
 def create_bundle_safe(connection, bundle_name, bundle_type):
@@ -165,9 +256,34 @@ def create_bundle_safe(connection, bundle_name, bundle_type):
     return connection.getBundle(bundle_type, bundle_name)
 
 
+def get_tag_import_levels(tags):
+    """
+    Tag that is a prefix of other tags has to be created after them. Returns dict from tag to number
+    of the round it should be imported in: 0 for tags that are not prefixes of other tags, for other tags
+    one more than the highest round of tags they are prefixes of.
+    """
+    levels = dict([])
+    # in sorted order tags starting with a prefix follow it, so the stack always holds a chain of prefixes
+    stack = []
+
+    def pop():
+        tag = stack.pop()
+        if len(stack):
+            levels[stack[-1]] = max(levels[stack[-1]], levels[tag] + 1)
+
+    for tag in sorted(set(tags)):
+        while len(stack) and not tag.startswith(stack[-1]):
+            pop()
+        stack.append(tag)
+        levels[tag] = 0
+    while len(stack):
+        pop()
+    return levels
+
+
 def calculate_missing_value_names(bundle, value_names):
-    bundle_elements_names = [elem.name.lower() for elem in bundle.values]
-    return [value for value in value_names if value.lower() not in bundle_elements_names]
+    bundle_elements_names = get_bundle_value_keys(bundle)
+    return [value for value in value_names if value.casefold() not in bundle_elements_names]
 
 
 class LogicException(Exception):
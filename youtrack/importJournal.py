@@ -0,0 +1,56 @@
+from youtrack.sqliteStore import SqliteStore
+
+# project id used for stages that are not bound to a project
+GLOBAL = ''
+
+
+class ImportJournal(SqliteStore):
+    """
+    Records import progress: finished stages of every project, imported issues, attachments,
+    link batches and users. When the journal is kept in a file, an import that has been
+    interrupted can be restarted with the same journal and continues where it stopped.
+    By default the journal is kept in memory and lives as long as the importer.
+    """
+
+    _schema = (
+        'CREATE TABLE IF NOT EXISTS stages (project_id TEXT, stage TEXT, PRIMARY KEY (project_id, stage))',
+        'CREATE TABLE IF NOT EXISTS issues (project_id TEXT, number TEXT, PRIMARY KEY (project_id, number))',
+        'CREATE TABLE IF NOT EXISTS attachments (issue_id TEXT, name TEXT, PRIMARY KEY (issue_id, name))',
+        'CREATE TABLE IF NOT EXISTS link_batches (project_id TEXT, after INTEGER, PRIMARY KEY (project_id, after))',
+        'CREATE TABLE IF NOT EXISTS users (login TEXT PRIMARY KEY)',
+    )
+
+    def is_stage_done(self, project_id, stage):
+        return len(self._execute('SELECT 1 FROM stages WHERE project_id = ? AND stage = ?',
+                                 (project_id, stage))) > 0
+
+    def stage_done(self, project_id, stage):
+        self._execute('INSERT OR IGNORE INTO stages VALUES (?, ?)', (project_id, stage))
+
+    def get_imported_issues(self, project_id):
+        return set([row[0] for row in self._execute('SELECT number FROM issues WHERE project_id = ?',
+                                                    (project_id,))])
+
+    def issues_imported(self, project_id, numbers):
+        self._executemany('INSERT OR IGNORE INTO issues VALUES (?, ?)',
+                          [(project_id, str(number)) for number in numbers])
+
+    def is_attachment_imported(self, issue_id, name):
+        return len(self._execute('SELECT 1 FROM attachments WHERE issue_id = ? AND name = ?',
+                                 (issue_id, name))) > 0
+
+    def attachment_imported(self, issue_id, name):
+        self._execute('INSERT OR IGNORE INTO attachments VALUES (?, ?)', (issue_id, name))
+
+    def get_imported_link_batches(self, project_id):
+        return set([row[0] for row in self._execute('SELECT after FROM link_batches WHERE project_id = ?',
+                                                    (project_id,))])
+
+    def link_batch_imported(self, project_id, after):
+        self._execute('INSERT OR IGNORE INTO link_batches VALUES (?, ?)', (project_id, after))
+
+    def get_imported_users(self):
+        return set([row[0] for row in self._execute('SELECT login FROM users')])
+
+    def users_imported(self, logins):
+        self._executemany('INSERT OR IGNORE INTO users VALUES (?)', [(login,) for login in logins])
@@ -0,0 +1,93 @@
+import queue
+import threading
+
+_STOP = object()
+
+
+class PipelineStage(object):
+    def __init__(self, name, handler, workers=1):
+        """
+        Args:
+            name: Name of the stage, used in thread names.
+            handler: Callable that accepts an item and returns the item for the next stage.
+                If it returns None, the item is not passed further.
+            workers: Number of threads that run handler concurrently.
+        """
+        if workers < 1:
+            raise ValueError("Stage [ %s ] must have at least one worker" % name)
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+
+
+class Pipeline(object):
+    """
+    Runs items through a chain of stages, every stage in its own pool of threads.
+    Stages are connected with bounded queues, so a stage that gets ahead of the next one
+    blocks instead of accumulating items in memory, and the total throughput is limited
+    by the slowest stage only.
+    """
+
+    def __init__(self, stages, queue_size=2):
+        if not len(stages):
+            raise ValueError("Pipeline must have at least one stage")
+        self._stages = stages
+        self._queue_size = queue_size
+        self._error = None
+        self._failed = threading.Event()
+        self._lock = threading.Lock()
+
+    def run(self, items):
+        """
+        Feeds items to the first stage from the calling thread and waits until
+        all stages are done. The first exception raised by any stage stops feeding
+        and is re-raised here after all threads have finished.
+        """
+        queues = [queue.Queue(self._queue_size) for _ in self._stages]
+        threads = []
+        for i, stage in enumerate(self._stages):
+            out_queue = queues[i + 1] if i + 1 < len(queues) else None
+            stage_threads = [threading.Thread(target=self._work, args=(stage, queues[i], out_queue),
+                                              name='%s-%d' % (stage.name, n))
+                             for n in range(stage.workers)]
+            for t in stage_threads:
+                t.daemon = True
+                t.start()
+            threads.append(stage_threads)
+        try:
+            for item in items:
+                if self._failed.is_set():
+                    break
+                queues[0].put(item)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            for i, stage in enumerate(self._stages):
+                for _ in range(stage.workers):
+                    queues[i].put(_STOP)
+                for t in threads[i]:
+                    t.join()
+        if self._error is not None:
+            raise self._error
+
+    def _work(self, stage, in_queue, out_queue):
+        while True:
+            item = in_queue.get()
+            if item is _STOP:
+                return
+            # after a failure items are only drained, so that upstream stages are not blocked
+            if self._failed.is_set():
+                continue
+            try:
+                result = stage.handler(item)
+            except Exception as e:
+                self._fail(e)
+                continue
+            if (result is not None) and (out_queue is not None):
+                out_queue.put(result)
+
+    def _fail(self, error):
+        with self._lock:
+            if self._error is None:
+                self._error = error
+        self._failed.set()
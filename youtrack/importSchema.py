@@ -0,0 +1,116 @@
+import threading
+
+from youtrack import YouTrackException
+from youtrack.importHelper import ensure_bundle_values, get_bundle_value_keys, get_value_key
+
+
+class CustomFieldTypes(object):
+    """
+    Types of all custom field prototypes of a YouTrack instance. Loaded on the first
+    request and then kept in sync with the fields created through this object's owner.
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+        self._types = None
+        self._lock = threading.RLock()
+
+    def _load(self):
+        with self._lock:
+            if self._types is None:
+                self._types = dict([(cf.name, cf.type) for cf in self._connection.getCustomFields()])
+            return self._types
+
+    def get_type(self, field_name):
+        return self._load().get(field_name)
+
+    def field_created(self, field_name, field_type):
+        with self._lock:
+            if self._types is not None:
+                self._types[field_name] = field_type
+
+
+class ProjectSchema(object):
+    """
+    Snapshot of project custom fields, their bundles and bundle values. Every piece is
+    requested from YouTrack only once, values added through add_value are recorded locally,
+    so answering whether a field or a value exists costs no requests.
+    """
+
+    def __init__(self, connection, project_id):
+        self._connection = connection
+        self._project_id = project_id
+        self._fields = None
+        self._bundles = dict([])
+        self._bundle_values = dict([])
+        self._lock = threading.RLock()
+
+    def _load(self):
+        with self._lock:
+            if self._fields is None:
+                self._fields = dict([(pcf.name, pcf) for pcf in
+                                     self._connection.getProjectCustomFields(self._project_id)])
+            return self._fields
+
+    def has_field(self, field_name):
+        return field_name in self._load()
+
+    def get_field(self, field_name):
+        return self._load().get(field_name)
+
+    def field_attached(self, field_name):
+        """
+        Should be called after field_name has been attached to the project.
+        """
+        with self._lock:
+            if self._fields is None:
+                return
+            try:
+                self._fields[field_name] = self._connection.getProjectCustomField(self._project_id, field_name)
+            except YouTrackException:
+                self._fields.pop(field_name, None)
+
+    def get_bundle(self, field_name):
+        """
+        Returns bundle of project field field_name or None if the field has no bundle.
+        """
+        with self._lock:
+            if field_name not in self._bundles:
+                pcf = self.get_field(field_name)
+                if pcf is None or not hasattr(pcf, 'bundle'):
+                    self._bundles[field_name] = None
+                else:
+                    bundle = self._connection.getBundle(pcf.type, pcf.bundle)
+                    self._bundles[field_name] = bundle
+                    self._bundle_values[field_name] = get_bundle_value_keys(bundle)
+            return self._bundles[field_name]
+
+    def has_value(self, field_name, value):
+        with self._lock:
+            if self.get_bundle(field_name) is None:
+                return False
+            return get_value_key(value) in self._bundle_values[field_name]
+
+    def add_value(self, field_name, value):
+        """
+        Adds value to the bundle of project field field_name unless the bundle already has it.
+        Returns False if the field has no bundle.
+        """
+        results = self.add_values(field_name, [value])
+        if results is None:
+            return False
+        for result in results:
+            if result.error is not None:
+                raise result.error
+        return True
+
+    def add_values(self, field_name, values):
+        """
+        Adds values missing from the bundle of project field field_name.
+        Returns list of BundleValueResult or None if the field has no bundle.
+        """
+        with self._lock:
+            bundle = self.get_bundle(field_name)
+            if bundle is None:
+                return None
+            return ensure_bundle_values(self._connection, bundle, values, self._bundle_values[field_name])
@@ -0,0 +1,86 @@
+import threading
+
+from youtrack import YouTrackException
+
+
+class UserProvisioner(object):
+    """
+    Imports users met during issue import. Every distinct login is imported only once,
+    new users are collected and imported by batches of batch_size users, after that
+    missing groups are created and group memberships are set, each group and
+    membership only once. Actions that need a user to exist, like adding it to a bundle,
+    are scheduled with when_imported and run after the batch of the user is imported.
+    """
+
+    def __init__(self, connection, batch_size=100, journal=None):
+        self._connection = connection
+        self._batch_size = batch_size
+        self._journal = journal
+        self._known_logins = journal.get_imported_users() if journal is not None else set([])
+        self._pending = []
+        self._pending_logins = set([])
+        self._pending_actions = dict([])
+        self._created_groups = set([])
+        self._memberships = set([])
+        self._lock = threading.RLock()
+
+    def add(self, user):
+        """
+        Schedules user for import, unless it has been met before.
+        """
+        with self._lock:
+            if user.login in self._known_logins or user.login in self._pending_logins:
+                return
+            self._pending_logins.add(user.login)
+            self._pending.append(user)
+            if len(self._pending) >= self._batch_size:
+                self.flush()
+
+    def when_imported(self, login, action):
+        """
+        Calls action without arguments when user with login has been imported, at once if
+        it has been imported already or is not scheduled for import.
+        """
+        with self._lock:
+            if login in self._pending_logins:
+                self._pending_actions.setdefault(login, []).append(action)
+                return
+        action()
+
+    def flush(self):
+        """
+        Imports all scheduled users. Must be called before anything that needs them to exist.
+        """
+        with self._lock:
+            if not len(self._pending):
+                return
+            users = self._pending
+            self._pending = []
+            try:
+                self._connection.importUsers(users)
+            except Exception:
+                # users stay scheduled, so the next flush tries them again
+                self._pending = users + self._pending
+                raise
+            for user in users:
+                self._pending_logins.discard(user.login)
+                self._known_logins.add(user.login)
+            if self._journal is not None:
+                self._journal.users_imported([user.login for user in users])
+            memberships = []
+            for user in users:
+                for group in user.getGroups():
+                    if group.name not in self._created_groups:
+                        try:
+                            self._connection.createGroup(group)
+                        except YouTrackException:
+                            pass
+                        self._created_groups.add(group.name)
+                    if (user.login, group.name) not in self._memberships:
+                        memberships.append((user.login, group.name))
+            for login, group_name in memberships:
+                self._connection.setUserGroup(login, group_name)
+                self._memberships.add((login, group_name))
+            for user in users:
+                for action in self._pending_actions.pop(user.login, []):
+                    action()
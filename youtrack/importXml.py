@@ -0,0 +1,61 @@
+from xml.sax.saxutils import escape, quoteattr
+
+
+class IssuesXmlWriter(object):
+    """
+    Writes issues straight into the body of an /import/{project}/issues request, without
+    building Issue objects first. Issues are added as plain field dicts.
+    """
+
+    def __init__(self, bad_fields=()):
+        self._bad_fields = set(bad_fields)
+        self._records = []
+        self._numbers = dict([])
+
+    def add_issue(self, number, fields, comments=()):
+        """
+        Args:
+            number: Number of the issue in project.
+            fields: Dict from YouTrack field name to a value or a list of values.
+            comments: Comments, every one is a dict (or a Comment) from attribute name to value.
+        """
+        number = str(number)
+        parts = ['  <issue>\n',
+                 '    <field name="numberInProject">\n      <value>%s</value>\n    </field>\n' % escape(number)]
+        for (name, value) in list(fields.items()):
+            if value is None or name == 'numberInProject' or name in self._bad_fields:
+                continue
+            parts.append('    <field name=%s>\n' % quoteattr(name))
+            if isinstance(value, (list, tuple, set)):
+                for v in value:
+                    parts.append('      <value>%s</value>\n' % escape(str(v).strip()))
+            else:
+                parts.append('      <value>%s</value>\n' % escape(str(value).strip()))
+            parts.append('    </field>\n')
+        for comment in comments:
+            parts.append('    <comment')
+            for attr in comment:
+                value = comment[attr]
+                if value is None:
+                    continue
+                parts.append(' %s=%s' % (attr, quoteattr(str(value), {"\n": "&#xA;"})))
+            parts.append('/>\n')
+        parts.append('  </issue>\n')
+        self._numbers[number] = len(self._records)
+        self._records.append(''.join(parts))
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, number):
+        return str(number) in self._numbers
+
+    @property
+    def numbers(self):
+        return list(self._numbers.keys())
+
+    def get_record(self, number):
+        return self._records[self._numbers[str(number)]]
+
+    def toxml(self):
+        return ('<issues>\n' + ''.join(self._records) + '</issues>').encode('utf-8')
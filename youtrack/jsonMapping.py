@@ -0,0 +1,104 @@
+"""
+Maps JSON responses of the REST API to the same YouTrackObject classes that are built from XML.
+
+Objects are JSON dicts with plain attributes and a "field" list of {"name": ..., "value": ...}
+items, the same way XML elements have attributes and <field> children. A field with a single
+value gets the value itself, as with XML.
+
+Responses are decoded with orjson or ujson when one of them is installed, json is used otherwise.
+"""
+
+import json
+
+import youtrack
+
+try:
+    import orjson as _fast_json
+except ImportError:
+    try:
+        import ujson as _fast_json
+    except ImportError:
+        _fast_json = None
+
+use_fast_decoder = True
+
+
+def loads(content):
+    if use_fast_decoder and _fast_json is not None:
+        return _fast_json.loads(content)
+    if isinstance(content, bytes):
+        content = content.decode('utf-8')
+    return json.loads(content)
+
+
+def get_decoder_name():
+    if use_fast_decoder and _fast_json is not None:
+        return _fast_json.__name__
+    return 'json'
+
+
+def _value(value):
+    if isinstance(value, dict):
+        return value.get('value', value.get('name'))
+    return value
+
+
+def update_object(obj, data, skipped_fields=()):
+    """
+    Sets attributes and fields of JSON object data to YouTrackObject obj.
+    """
+    for (name, value) in list(data.items()):
+        if name == 'field':
+            continue
+        if not isinstance(value, (dict, list)):
+            setattr(obj, name, value if isinstance(value, str) or value is None else str(value))
+    for field in data.get('field', ()):
+        name = field.get('name')
+        if not name or name in skipped_fields:
+            continue
+        value = field.get('value')
+        if isinstance(value, list):
+            values = [_value(v) for v in value]
+            value = values[0] if len(values) == 1 else values
+        else:
+            value = _value(value)
+        if value is None:
+            continue
+        setattr(obj, name, value if isinstance(value, (str, list)) else str(value))
+        if 'xsi:type' in field:
+            obj._attribute_types[name] = field['xsi:type']
+    return obj
+
+
+def to_object(cls, data, connection=None):
+    return update_object(cls(None, connection), data)
+
+
+def to_objects(cls, data, connection=None, key=None):
+    """
+    Args:
+        data: List of JSON objects, or a dict holding the list under key.
+    """
+    if isinstance(data, dict):
+        data = data.get(key, []) if key is not None else []
+    return [to_object(cls, item, connection) for item in data]
+
+
+def to_issue(data, connection=None, loaded_fields=None):
+    issue = youtrack.Issue(None, connection, loaded_fields)
+    # links and attachments are not given in the form of <issueLink> and <fileUrl>,
+    # so they are left unloaded as for XML issues without them
+    update_object(issue, data, ('links', 'attachments'))
+    issue.links = None
+    issue.attachments = None
+    tags = data.get('tag')
+    issue.tags = [_value(tag) for tag in tags] if tags else None
+    if hasattr(issue, 'fixedInBuild') and issue.fixedInBuild == 'Next build':
+        issue.fixedInBuild = None
+    return issue
+
+
+def to_issues(data, connection=None, loaded_fields=None):
+    if isinstance(data, dict):
+        data = data.get('issue', [])
+    return [to_issue(item, connection, loaded_fields) for item in data]
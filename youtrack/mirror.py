@@ -0,0 +1,161 @@
+"""
+Local SQLite mirror of YouTrack projects for reporting.
+
+Issues, their fields, comments and links are kept in a SQLite database and refreshed
+incrementally: every refresh requests only issues updated since the watermark of the
+project, the same way sync requests issues with get_advanced_query.
+"""
+
+import sqlite3
+
+from youtrack.sqliteStore import SqliteStore
+from youtrack.updatesHelper import get_updated_query, to_int
+
+# fields that have own columns in the issues table or are not stored at all
+_ISSUE_COLUMNS = ('id', 'projectShortName', 'numberInProject', 'summary', 'description', 'created', 'updated',
+                  'resolved')
+_SKIPPED_ATTRIBUTES = ('youtrack', '_attribute_types', '_loaded_fields', 'links', 'attachments')
+
+
+class IssueMirror(SqliteStore):
+    """
+    Mirror of issues of one or more projects. Full-text search over summaries, descriptions
+    and comments uses FTS5 when SQLite is built with it and LIKE otherwise.
+    Issues deleted in YouTrack are not noticed by incremental refresh.
+    """
+
+    _schema = (
+        'CREATE TABLE IF NOT EXISTS issues (id TEXT PRIMARY KEY, project_id TEXT, number INTEGER, summary TEXT, '
+        'description TEXT, created INTEGER, updated INTEGER, resolved INTEGER)',
+        'CREATE INDEX IF NOT EXISTS issues_by_project ON issues (project_id, resolved)',
+        'CREATE TABLE IF NOT EXISTS fields (issue_id TEXT, name TEXT, value TEXT)',
+        'CREATE INDEX IF NOT EXISTS fields_by_issue ON fields (issue_id)',
+        'CREATE INDEX IF NOT EXISTS fields_by_value ON fields (name, value)',
+        'CREATE TABLE IF NOT EXISTS comments (id TEXT, issue_id TEXT, author TEXT, created INTEGER, text TEXT)',
+        'CREATE INDEX IF NOT EXISTS comments_by_issue ON comments (issue_id)',
+        'CREATE TABLE IF NOT EXISTS links (type_name TEXT, source TEXT, target TEXT, '
+        'PRIMARY KEY (type_name, source, target))',
+        'CREATE INDEX IF NOT EXISTS links_by_target ON links (target)',
+        'CREATE TABLE IF NOT EXISTS watermarks (project_id TEXT PRIMARY KEY, updated INTEGER)',
+    )
+
+    def __init__(self, path=':memory:'):
+        SqliteStore.__init__(self, path)
+        try:
+            self._execute('CREATE VIRTUAL TABLE IF NOT EXISTS issues_fts USING fts5 '
+                          '(issue_id UNINDEXED, summary, description, comments)')
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False
+
+    def get_watermark(self, project_id):
+        rows = self._execute('SELECT updated FROM watermarks WHERE project_id = ?', (project_id,))
+        return rows[0][0] if len(rows) else None
+
+    def refresh(self, connection, project_id, batch=100, overlap=300):
+        """
+        Loads issues of project updated since the last refresh, all of them on the first one.
+
+        Args:
+            connection: Connection to the YouTrack.
+            project_id: Short name of the project.
+            overlap: Seconds the requested window starts before the watermark, see
+                get_updated_query. Issues met twice are just stored again.
+
+        Returns:
+            Number of stored issues.
+        """
+        watermark = self.get_watermark(project_id)
+        query = ''
+        if watermark is not None:
+            query = get_updated_query(watermark, overlap)
+        stored = 0
+        start = 0
+        while True:
+            issues = connection.getIssues(project_id, query, start, batch)
+            if not len(issues):
+                break
+            for issue in issues:
+                self.store_issue(project_id, issue, connection.getComments(issue.id),
+                                 issue.links if issue.links is not None else connection.getLinks(issue.id))
+                updated = to_int(getattr(issue, 'updated', None))
+                if updated is not None and (watermark is None or updated > watermark):
+                    watermark = updated
+            stored += len(issues)
+            start += batch
+        if watermark is not None:
+            self._execute('INSERT OR REPLACE INTO watermarks VALUES (?, ?)', (project_id, watermark))
+        return stored
+
+    def store_issue(self, project_id, issue, comments, links):
+        """
+        Replaces everything stored about issue with its current state.
+        """
+        issue_id = str(issue.id)
+        fields = []
+        for (name, value) in list(issue.__dict__.items()):
+            if name in _ISSUE_COLUMNS or name in _SKIPPED_ATTRIBUTES or value is None:
+                continue
+            for v in (value if isinstance(value, (list, tuple, set)) else [value]):
+                fields.append((issue_id, name, str(v)))
+        with self._lock, self._db:
+            db = self._db
+            db.execute('INSERT OR REPLACE INTO issues VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                       (issue_id, project_id, to_int(getattr(issue, 'numberInProject', None)),
+                        getattr(issue, 'summary', None), getattr(issue, 'description', None),
+                        to_int(getattr(issue, 'created', None)), to_int(getattr(issue, 'updated', None)),
+                        to_int(getattr(issue, 'resolved', None))))
+            db.execute('DELETE FROM fields WHERE issue_id = ?', (issue_id,))
+            db.executemany('INSERT INTO fields VALUES (?, ?, ?)', fields)
+            db.execute('DELETE FROM comments WHERE issue_id = ?', (issue_id,))
+            db.executemany('INSERT INTO comments VALUES (?, ?, ?, ?, ?)',
+                           [(getattr(comment, 'id', None), issue_id, getattr(comment, 'author', None),
+                             to_int(getattr(comment, 'created', None)), comment.text) for comment in comments])
+            db.execute('DELETE FROM links WHERE source = ? OR target = ?', (issue_id, issue_id))
+            db.executemany('INSERT OR IGNORE INTO links VALUES (?, ?, ?)',
+                           [(link.typeName, link.source, link.target) for link in links])
+            if self.fts:
+                db.execute('DELETE FROM issues_fts WHERE issue_id = ?', (issue_id,))
+                db.execute('INSERT INTO issues_fts VALUES (?, ?, ?, ?)',
+                           (issue_id, getattr(issue, 'summary', None), getattr(issue, 'description', None),
+                            '\n'.join([comment.text for comment in comments])))
+
+    def query(self, sql, params=()):
+        """
+        Runs any SELECT over the mirror tables and returns the rows.
+        """
+        return self._execute(sql, params)
+
+    def search(self, text, project_id=None):
+        """
+        Returns ids of issues with text in summary, description or comments. With FTS5 text is
+        an FTS5 query, otherwise it is searched for as a substring.
+        """
+        if self.fts:
+            sql = 'SELECT f.issue_id FROM issues_fts f JOIN issues i ON i.id = f.issue_id WHERE issues_fts MATCH ?'
+            params = [text]
+        else:
+            pattern = '%' + text + '%'
+            sql = ('SELECT i.id FROM issues i WHERE (i.summary LIKE ? OR i.description LIKE ? OR EXISTS '
+                   '(SELECT 1 FROM comments c WHERE c.issue_id = i.id AND c.text LIKE ?))')
+            params = [pattern, pattern, pattern]
+        if project_id is not None:
+            sql += ' AND i.project_id = ?'
+            params.append(project_id)
+        return [row[0] for row in self._execute(sql, params)]
+
+    def get_open_issues_linked_to(self, linked_project_id, project_id=None):
+        """
+        Returns ids of unresolved issues having a link of any direction to an issue of
+        linked_project_id, only issues of project_id when it is given.
+        """
+        # LIKE would take _ in project ids for a wildcard and ignore case
+        prefix = linked_project_id + '-'
+        sql = ('SELECT i.id FROM issues i WHERE i.resolved IS NULL AND ('
+               'EXISTS (SELECT 1 FROM links l WHERE l.source = i.id AND substr(l.target, 1, length(?)) = ?) OR '
+               'EXISTS (SELECT 1 FROM links l WHERE l.target = i.id AND substr(l.source, 1, length(?)) = ?))')
+        params = [prefix, prefix, prefix, prefix]
+        if project_id is not None:
+            sql += ' AND i.project_id = ?'
+            params.append(project_id)
+        return [row[0] for row in self._execute(sql, params)]
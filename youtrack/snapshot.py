@@ -0,0 +1,203 @@
+"""
+Offline snapshots of YouTrack projects.
+
+A snapshot file keeps one record per issue: issue fields, comments, outward links, work items
+and attachment metadata. Records are JSON, length-prefixed and grouped into zlib-compressed
+chunks. An index of chunk offsets and issue positions is written at the end of the file, so
+issues can be read one by one or looked up by id without decompressing the whole file.
+
+File layout:
+    MAGIC
+    chunk*           4 bytes length + zlib(record*), record is 4 bytes length + JSON
+    index            zlib(JSON {"chunks": [offset, ...], "issues": {id: [chunk, position]}})
+    8 bytes offset of the index + INDEX_MAGIC
+"""
+
+import json
+import struct
+import zlib
+
+import youtrack
+
+MAGIC = b'YTSNAP1\n'
+INDEX_MAGIC = b'YTSNAPIX'
+
+_LENGTH = struct.Struct('>I')
+_OFFSET = struct.Struct('>Q')
+
+
+def object_to_dict(obj):
+    """
+    Plain data of a YouTrackObject: its attributes, nested objects are converted as well.
+    """
+    if isinstance(obj, youtrack.YouTrackObject):
+        return dict([(name, object_to_dict(value)) for (name, value) in list(obj.__dict__.items())
+                     if name not in ('youtrack', '_attribute_types', '_loaded_fields')])
+    if isinstance(obj, (list, tuple, set)):
+        return [object_to_dict(value) for value in obj]
+    if isinstance(obj, dict):
+        return dict([(str(name), object_to_dict(value)) for (name, value) in list(obj.items())])
+    if isinstance(obj, bytes):
+        return obj.decode('utf-8')
+    return obj
+
+
+class SnapshotWriter(object):
+    """
+    Writes issue records to a snapshot file. Only the current chunk and the index are kept
+    in memory. close must be called to write the index.
+    """
+
+    def __init__(self, path, chunk_size=100, compress_level=6):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.compress_level = compress_level
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._chunk = []
+        self._chunks = []
+        self._issues = dict([])
+
+    def add_issue(self, issue, comments=(), links=(), work_items=(), attachments=()):
+        """
+        Args:
+            issue: Issue to add, its id is the key of the record.
+            comments, links, work_items, attachments: Related YouTrack objects of the issue.
+        """
+        record = {'issue': object_to_dict(issue),
+                  'comments': object_to_dict(list(comments)),
+                  'links': object_to_dict(list(links)),
+                  'work_items': object_to_dict(list(work_items)),
+                  'attachments': object_to_dict(list(attachments))}
+        # links and attachments have own lists in the record
+        record['issue'].pop('links', None)
+        record['issue'].pop('attachments', None)
+        self._issues[str(issue.id)] = [len(self._chunks), len(self._chunk)]
+        self._chunk.append(json.dumps(record, ensure_ascii=False).encode('utf-8'))
+        if len(self._chunk) >= self.chunk_size:
+            self._flush_chunk()
+
+    def __len__(self):
+        return len(self._issues)
+
+    def _flush_chunk(self):
+        if not len(self._chunk):
+            return
+        data = b''.join([_LENGTH.pack(len(record)) + record for record in self._chunk])
+        data = zlib.compress(data, self.compress_level)
+        self._chunks.append(self._file.tell())
+        self._file.write(_LENGTH.pack(len(data)))
+        self._file.write(data)
+        self._chunk = []
+
+    def close(self):
+        if self._file is None:
+            return
+        self._flush_chunk()
+        index_offset = self._file.tell()
+        self._file.write(zlib.compress(json.dumps({'chunks': self._chunks, 'issues': self._issues}).encode('utf-8')))
+        self._file.write(_OFFSET.pack(index_offset) + INDEX_MAGIC)
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SnapshotReader(object):
+    """
+    Reads a snapshot file. Records are dicts with keys issue, comments, links, work_items
+    and attachments, holding plain data of the exported objects.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        if self._file.read(len(MAGIC)) != MAGIC:
+            raise ValueError('Not a snapshot file: ' + path)
+        self._file.seek(-(_OFFSET.size + len(INDEX_MAGIC)), 2)
+        trailer = self._file.read()
+        if trailer[_OFFSET.size:] != INDEX_MAGIC:
+            raise ValueError('Snapshot file has no index, probably it has not been closed: ' + path)
+        index_offset = _OFFSET.unpack(trailer[:_OFFSET.size])[0]
+        self._file.seek(index_offset)
+        data = self._file.read()[:-(_OFFSET.size + len(INDEX_MAGIC))]
+        index = json.loads(zlib.decompress(data).decode('utf-8'))
+        self._chunks = index['chunks']
+        self._issues = index['issues']
+        self._cached_chunk = (None, None)
+
+    def __len__(self):
+        return len(self._issues)
+
+    def __contains__(self, issue_id):
+        return str(issue_id) in self._issues
+
+    @property
+    def issue_ids(self):
+        return list(self._issues.keys())
+
+    def __iter__(self):
+        for number in range(len(self._chunks)):
+            for record in self._read_chunk(number):
+                yield json.loads(record.decode('utf-8'))
+
+    def get(self, issue_id):
+        """
+        Returns the record of issue with issue_id, raises KeyError if there is no such issue.
+        """
+        number, position = self._issues[str(issue_id)]
+        return json.loads(self._read_chunk(number)[position].decode('utf-8'))
+
+    def _read_chunk(self, number):
+        # the last chunk is kept, neighbouring issues are usually read together
+        if self._cached_chunk[0] == number:
+            return self._cached_chunk[1]
+        self._file.seek(self._chunks[number])
+        length = _LENGTH.unpack(self._file.read(_LENGTH.size))[0]
+        data = zlib.decompress(self._file.read(length))
+        records = []
+        position = 0
+        while position < len(data):
+            record_length = _LENGTH.unpack_from(data, position)[0]
+            position += _LENGTH.size
+            records.append(data[position:position + record_length])
+            position += record_length
+        self._cached_chunk = (number, records)
+        return records
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def export_project_snapshot(connection, project_id, path, query='', batch=100, chunk_size=100):
+    """
+    Writes all issues of project matching query with their comments, outward links,
+    work items and attachment metadata to a snapshot file.
+
+    Returns:
+        Number of exported issues.
+    """
+    with SnapshotWriter(path, chunk_size) as writer:
+        start = 0
+        while True:
+            issues = connection.getIssues(project_id, query, start, batch)
+            if not len(issues):
+                break
+            for issue in issues:
+                writer.add_issue(issue,
+                                 comments=connection.getComments(issue.id),
+                                 links=connection.getLinks(issue.id, True),
+                                 work_items=connection.getWorkItems(issue.id),
+                                 attachments=connection.getAttachments(issue.id))
+            start += batch
+        return len(writer)
@@ -0,0 +1,34 @@
+import sqlite3
+import threading
+
+
+class SqliteStore(object):
+    """
+    Base class of small persistent stores kept in a SQLite database. The connection
+    is shared between threads, all statements are serialized by a lock and every
+    call of _execute or _executemany is a separate transaction.
+    Subclasses list CREATE statements of their tables in _schema.
+    """
+
+    _schema = ()
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        # several processes may share a store, so wait for locks of other writers long enough
+        self._db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._lock = threading.RLock()
+        with self._lock, self._db:
+            for statement in self._schema:
+                self._db.execute(statement)
+
+    def _execute(self, sql, params=()):
+        with self._lock, self._db:
+            return self._db.execute(sql, params).fetchall()
+
+    def _executemany(self, sql, seq_of_params):
+        with self._lock, self._db:
+            self._db.executemany(sql, seq_of_params)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,70 @@
+import json
+
+from youtrack import ChangeField, IssueChange
+from youtrack.sqliteStore import SqliteStore
+
+
+def _change_to_json(change):
+    return json.dumps({'updated': change.updated,
+                       'updater_name': change.updater_name,
+                       'comments': change.comments,
+                       'fields': [[field.name, field.old_value, field.new_value] for field in change.fields]})
+
+
+def _change_from_json(data):
+    data = json.loads(data)
+    change = IssueChange()
+    change.updated = data['updated']
+    change.updater_name = data['updater_name']
+    change.comments = data['comments']
+    for name, old_value, new_value in data['fields']:
+        field = ChangeField()
+        field.name = name
+        field.old_value = old_value
+        field.new_value = new_value
+        change.fields.append(field)
+    return change
+
+
+class ChangeCache(SqliteStore):
+    """
+    Persistent cache of parsed issue changes. For every issue it keeps the time of the latest
+    cached change (watermark), so that only changes made after it are parsed on the next run.
+    Changes of different YouTrack instances are told apart by connection url.
+    """
+
+    _schema = (
+        'CREATE TABLE IF NOT EXISTS changes (yt TEXT, issue_id TEXT, updated INTEGER, data TEXT)',
+        'CREATE INDEX IF NOT EXISTS changes_by_issue ON changes (yt, issue_id, updated)',
+        'CREATE TABLE IF NOT EXISTS watermarks (yt TEXT, issue_id TEXT, updated INTEGER, '
+        'PRIMARY KEY (yt, issue_id))',
+    )
+
+    def get_watermark(self, yt, issue_id):
+        rows = self._execute('SELECT updated FROM watermarks WHERE yt = ? AND issue_id = ?', (yt.url, issue_id))
+        return rows[0][0] if len(rows) else None
+
+    def add_changes(self, yt, issue_id, changes):
+        if not len(changes):
+            return
+        with self._lock:
+            self._executemany('INSERT INTO changes VALUES (?, ?, ?, ?)',
+                              [(yt.url, issue_id, change.updated, _change_to_json(change)) for change in changes])
+            watermark = max(change.updated for change in changes)
+            self._execute('INSERT OR REPLACE INTO watermarks VALUES (?, ?, MAX(?, COALESCE('
+                          '(SELECT updated FROM watermarks WHERE yt = ? AND issue_id = ?), 0)))',
+                          (yt.url, issue_id, watermark, yt.url, issue_id))
+
+    def get_changes(self, yt, issue_id, after_ms, before_ms):
+        rows = self._execute('SELECT data FROM changes WHERE yt = ? AND issue_id = ? AND updated > ? AND updated < ? '
+                             'ORDER BY updated', (yt.url, issue_id, after_ms, before_ms))
+        return [_change_from_json(row[0]) for row in rows]
+
+    def update(self, yt, issue_id):
+        """
+        Fetches issue changes and caches the ones made after the watermark.
+        """
+        with self._lock:
+            watermark = self.get_watermark(yt, issue_id)
+        changes = yt.get_changes_for_issue(issue_id, after=watermark)
+        self.add_changes(yt, issue_id, changes)
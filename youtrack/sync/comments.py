@@ -1,35 +1,107 @@
-from youtrack import YouTrackException
+import hashlib
+
+from youtrack.sqliteStore import SqliteStore
+from youtrack.sync.users import sync_user
 
-COMPARISON_LENGTH = 10
 COMMAND = 'comment'
+MASTER = 'master'
+SLAVE = 'slave'
+
+
+def get_comment_hash(text):
+    return hashlib.sha1(text.strip().encode('utf-8')).hexdigest()
+
+
+def get_comment_created(comment):
+    try:
+        return int(getattr(comment, 'created', 0))
+    except ValueError:
+        return 0
+
+
+class CommentIndex(SqliteStore):
+    """
+    Comments already seen for every bound pair of issues: hashes of their full texts on each side
+    and the creation time of the latest seen comment on each side (watermark).
+    """
+
+    _schema = (
+        'CREATE TABLE IF NOT EXISTS hashes (master_id TEXT, slave_id TEXT, side TEXT, hash TEXT, '
+        'PRIMARY KEY (master_id, slave_id, side, hash))',
+        'CREATE TABLE IF NOT EXISTS watermarks (master_id TEXT, slave_id TEXT, side TEXT, created INTEGER, '
+        'PRIMARY KEY (master_id, slave_id, side))',
+    )
+
+    def get_hashes(self, master_id, slave_id, side):
+        return set([row[0] for row in self._execute('SELECT hash FROM hashes WHERE master_id = ? AND slave_id = ? '
+                                                    'AND side = ?', (master_id, slave_id, side))])
+
+    def add_hashes(self, master_id, slave_id, side, hashes):
+        self._executemany('INSERT OR IGNORE INTO hashes VALUES (?, ?, ?, ?)',
+                          [(master_id, slave_id, side, h) for h in hashes])
+
+    def get_watermark(self, master_id, slave_id, side):
+        rows = self._execute('SELECT created FROM watermarks WHERE master_id = ? AND slave_id = ? AND side = ?',
+                             (master_id, slave_id, side))
+        return rows[0][0] if len(rows) else None
+
+    def set_watermark(self, master_id, slave_id, side, created):
+        self._execute('INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?, ?)', (master_id, slave_id, side, created))
+
 
 class CommentSynchronizer(object):
-    def __init__(self, master, slave, master_executor, slave_executor):
+    def __init__(self, master, slave, master_executor, slave_executor, index=None):
         self.master = master
         self.slave = slave
         self.executors = {master : master_executor, slave : slave_executor}
+        self.index = index if index is not None else CommentIndex()
 
     def syncComments(self, master_id, slave_id):
-        slave_comments = self.slave.getComments(slave_id)
-        master_comments = self.master.getComments(master_id)
+        # comments created before the watermarks have been compared on previous syncs,
+        # their hashes are taken from the index
+        slave_comments = self._get_new_comments(self.slave, master_id, slave_id, SLAVE)
+        master_comments = self._get_new_comments(self.master, master_id, slave_id, MASTER)
         if len(slave_comments) or len(master_comments):
-            master_texts = set([cm.text[0:COMPARISON_LENGTH] for cm in master_comments])
-            slave_texts = set([cm.text[0:COMPARISON_LENGTH] for cm in slave_comments])
-            slave_unique = [cm for cm in slave_comments if cm.text[0:COMPARISON_LENGTH] not in master_texts]
-            master_unique = [cm for cm in master_comments if cm.text[0:COMPARISON_LENGTH] not in slave_texts]
-            for cm in slave_unique:
-                self._sync_comment(self.master, self.slave, master_id, cm.text, cm.author)
-            for cm in master_unique:
-                self._sync_comment(self.slave, self.master, slave_id, cm.text, cm.author)
+            master_hashes = self.index.get_hashes(master_id, slave_id, MASTER)
+            master_hashes |= set([get_comment_hash(cm.text) for cm in master_comments])
+            slave_hashes = self.index.get_hashes(master_id, slave_id, SLAVE)
+            slave_hashes |= set([get_comment_hash(cm.text) for cm in slave_comments])
+            slave_unique = [cm for cm in slave_comments if get_comment_hash(cm.text) not in master_hashes]
+            master_unique = [cm for cm in master_comments if get_comment_hash(cm.text) not in slave_hashes]
+            slave_failed = [cm for cm in slave_unique
+                            if not self._sync_comment(self.master, self.slave, master_id, cm.text, cm.author)]
+            master_failed = [cm for cm in master_unique
+                             if not self._sync_comment(self.slave, self.master, slave_id, cm.text, cm.author)]
+            # copies are equal to their originals, so both sides know all the texts now,
+            # except for the ones that failed to be copied and are tried again next time
+            failed_hashes = set([get_comment_hash(cm.text) for cm in slave_failed + master_failed])
+            known_hashes = (master_hashes | slave_hashes) - failed_hashes
+            self.index.add_hashes(master_id, slave_id, MASTER, known_hashes)
+            self.index.add_hashes(master_id, slave_id, SLAVE, known_hashes)
+            self._update_watermark(master_id, slave_id, MASTER, master_comments, master_failed)
+            self._update_watermark(master_id, slave_id, SLAVE, slave_comments, slave_failed)
+
+    def _get_new_comments(self, yt, master_id, slave_id, side):
+        issue_id = master_id if side == MASTER else slave_id
+        comments = yt.getComments(issue_id)
+        watermark = self.index.get_watermark(master_id, slave_id, side)
+        if watermark is None:
+            return comments
+        return [cm for cm in comments if get_comment_created(cm) > watermark]
+
+    def _update_watermark(self, master_id, slave_id, side, comments, failed=()):
+        # the watermark stays before the first comment that failed to be copied
+        if len(failed):
+            first_failed = min(get_comment_created(cm) for cm in failed)
+            comments = [cm for cm in comments if get_comment_created(cm) < first_failed]
+        if len(comments):
+            self.index.set_watermark(master_id, slave_id, side, max(get_comment_created(cm) for cm in comments))
 
     def _sync_comment(self, to_yt, from_yt, issue_id, comment_text, run_as):
         if comment_text is not None and comment_text != '':
             self._try_to_sync_user(to_yt, from_yt, run_as)
-            self.executors[to_yt].executeCommand(issue_id, COMMAND, comment=comment_text, run_as=run_as)
+            return self.executors[to_yt].executeCommand(issue_id, COMMAND, comment=comment_text, run_as=run_as)
+        return True
 
     def _try_to_sync_user(self, to_yt, from_yt, login):
-        try:
-            to_yt.getUser(login)
-        except YouTrackException:
-            user_to_import = from_yt.getUser(login)
-            self.executors[to_yt].executeUserImport(user_to_import)
+        sync_user(to_yt, from_yt, login, self.executors[to_yt])
@@ -12,6 +12,9 @@ class SafeCommandExecutor(object):
         self.debug_mode = on
 
     def executeCommand(self, issue_id, command, comment=None, run_as=None):
+        """
+        Returns False if the command failed, errors are logged and not raised.
+        """
         if command != '':
             try:
                 if not self.debug_mode:
@@ -22,15 +25,22 @@ class SafeCommandExecutor(object):
                     self.logger.logAction(issue_id, self.yt, 'applied command: \"' + command + '\"', run_as)
             except Exception as e:
                 self.logger.logError(e, issue_id, self.yt, 'failed to apply command: \"' + command + '\"', run_as)
+                return False
+        return True
 
     def executeUserImport(self, user):
+        """
+        Returns True if the user has been imported, in debug mode nothing is imported.
+        """
         if user:
             try:
                 if not self.debug_mode:
                     self.yt.importUsers([user])
                 self.logger.logAction('Import user', self.yt, 'imported user: \"' + str(user.login) + '\"')
+                return not self.debug_mode
             except YouTrackException as e:
                 self.logger.logError(e, 'Import user', self.yt, 'failed to import user: \"' + user.login + '\" - could not find in opposite youtrack')
+        return False
 
     def createIssue(self, project_id, summary, description, issue_from_id):
         try:
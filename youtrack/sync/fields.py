@@ -1,15 +1,18 @@
 import sys
 import time
 
-from youtrack import YouTrackException
+from youtrack.sync.users import sync_user
 from youtrack.sync.states import get_event
 
 PRIORITY_MAPPING= {'0':'Show-stopper', '1':'Critical', '2':'Major', '3':'Normal', '4':'Minor'}
 
-def get_issue_changes(yt, issue_id, start=None, finish=None):
-     result = yt.get_changes_for_issue(issue_id)
+def get_issue_changes(yt, issue_id, start=None, finish=None, cache=None):
      after_ms = get_in_milliseconds(start) if start else 0
      before_ms = get_in_milliseconds(finish) if finish else sys.maxsize
+     if cache is not None:
+         cache.update(yt, issue_id)
+         return cache.get_changes(yt, issue_id, after_ms, before_ms)
+     result = yt.get_changes_for_issue(issue_id)
      new_changes = []
      for change in result:
          change_time = change['updated']
@@ -21,16 +24,17 @@ def get_in_milliseconds(_datetime):
     return int(round(1e+3*time.mktime(_datetime.timetuple()) + 1e-3*_datetime.microsecond))
 
 class AsymmetricFieldsSynchronizer(object):
-    def __init__(self, master, slave, master_executor, slave_executor, fields_to_sync):
+    def __init__(self, master, slave, master_executor, slave_executor, fields_to_sync, change_cache=None):
         self.master = master
         self.slave = slave
         self.executors = {master : master_executor, slave : slave_executor}
         self.fields_to_sync = fields_to_sync
+        self.change_cache = change_cache
 
     def syncFields(self, master_issue_id, slave_issue_id, last_run, current_run):
         #sync fields
-        slave_changes = get_issue_changes(self.slave, slave_issue_id, last_run, current_run)
-        master_changes = get_issue_changes(self.master, master_issue_id, last_run, current_run)
+        slave_changes = get_issue_changes(self.slave, slave_issue_id, last_run, current_run, self.change_cache)
+        master_changes = get_issue_changes(self.master, master_issue_id, last_run, current_run, self.change_cache)
         #field changes made in master should rewrite any field changes in slave
         changed_fields = self._apply_changes_to_issue(self.slave, self.master, slave_issue_id, master_changes)
         self._apply_changes_to_issue(self.master, self.slave, master_issue_id, slave_changes, fields_to_ignore=changed_fields)
@@ -71,8 +75,4 @@ class AsymmetricFieldsSynchronizer(object):
         return command
 
     def _try_to_sync_user(self, to_yt, from_yt, login):
-        try:
-            to_yt.getUser(login)
-        except YouTrackException:
-            user_to_import = from_yt.getUser(login)
-            self.executors[to_yt].executeUserImport(user_to_import)
+        sync_user(to_yt, from_yt, login, self.executors[to_yt])
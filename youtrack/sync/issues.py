@@ -4,15 +4,15 @@ from youtrack.sync.comments import CommentSynchronizer
 
 
 class AsymmetricIssueMerger(object):
-    def __init__(self, master, slave, master_executor, slave_executor, issue_binder, link_synchronizer, fields_to_sync, last_run, current_run, project_id):
+    def __init__(self, master, slave, master_executor, slave_executor, issue_binder, link_synchronizer, fields_to_sync, last_run, current_run, project_id, change_cache=None, comment_index=None):
         self.master = master
         self.slave = slave
         self.master_executor = master_executor
         self.slave_executor = slave_executor
         self.last_run = last_run
         self.current_run = current_run
-        self.comment_sync = CommentSynchronizer(master, slave, master_executor, slave_executor)
-        self.field_sync = AsymmetricFieldsSynchronizer(master, slave, master_executor, slave_executor, fields_to_sync)
+        self.comment_sync = CommentSynchronizer(master, slave, master_executor, slave_executor, comment_index)
+        self.field_sync = AsymmetricFieldsSynchronizer(master, slave, master_executor, slave_executor, fields_to_sync, change_cache)
         self.issue_binder = issue_binder
         self.link_synchronizer = link_synchronizer
         self.project_id = project_id
@@ -1,9 +1,13 @@
 import copy
+import threading
+
+from youtrack.sqliteStore import SqliteStore
 
 class LinkImporter(object):
     def __init__(self, target, project_id=None, query=None):
         self.target = target
-        self.created_issue_ids = self._get_all_issue_ids_set(self.target, project_id, query) if project_id else set([])
+        self._issue_ids_cache = dict([])
+        self.created_issue_ids = set(self._get_all_issue_ids_set(self.target, project_id, query)) if project_id else set([])
         self.links = []
         self.verbose_mode = False
         self.target_name = "youtrack"
@@ -14,6 +18,10 @@ class LinkImporter(object):
 
     def resetConnections(self, target):
         self.target = target
+        self.resetIssueIdsCache()
+
+    def resetIssueIdsCache(self):
+        self._issue_ids_cache = dict([])
 
     def setYoutrackName(self, name):
         self.target_name = name
@@ -23,22 +31,26 @@ class LinkImporter(object):
 
     def _get_all_issue_ids_set(self, yt, project_id, query):
         if not query: query = ''
+        key = (project_id, query)
+        if key in self._issue_ids_cache:
+            return self._issue_ids_cache[key]
         start = 0
-        batch = 50
+        batch = 500
         result = set([])
         while True:
-            issues = yt.getIssues(project_id, query, start, batch)
-            if not len(issues): break
-            for issue in issues:
-                result.add(issue.id)
+            ids = yt.getIssueIds(project_id, query, start, batch)
+            if not len(ids): break
+            result.update(ids)
             start += batch
+        self._issue_ids_cache[key] = result
         return result
 
     def resetAvailableIssues(self):
         self.created_issue_ids = set([])
 
     def addAvailableIssuesFrom(self, project_id):
-        self.created_issue_ids |= self._get_all_issue_ids_set(self.target, project_id, None) if project_id else set([])
+        if project_id:
+            self.created_issue_ids |= self._get_all_issue_ids_set(self.target, project_id, None)
 
     def addAvailableIssues(self, issues):
         self.created_issue_ids |= set([issue.id for issue in issues])
@@ -88,8 +100,25 @@ class LinkSynchronizer(object):
         self.masterExecutor = master_executor
         self.master_links = []
         self.slave_links = []
+        self.bulk_mode = False
+        self._bulk_master_ids = set([])
+        self._bulk_slave_ids = set([])
+        self._lock = threading.Lock()
+
+    def setBulkMode(self, on):
+        """
+        In bulk mode links of synced issues are not requested issue by issue. Ids are only
+        remembered, and syncCollectedLinks reads all links of both sides once with
+        exportIssueLinks and computes the differences in memory. Pays off for full syncs.
+        """
+        self.bulk_mode = on
 
     def collectLinksToSyncById(self, master_issue_id, slave_issue_id):
+        if self.bulk_mode:
+            with self._lock:
+                if master_issue_id: self._bulk_master_ids.add(str(master_issue_id))
+                if slave_issue_id: self._bulk_slave_ids.add(str(slave_issue_id))
+            return
 
         slave_links = self.slaveExecutor.yt.getLinks(slave_issue_id, True) if slave_issue_id else []
         master_links = self.masterExecutor.yt.getLinks(master_issue_id, True) if master_issue_id else []
@@ -97,8 +126,9 @@ class LinkSynchronizer(object):
         to_master_links = set([self._convertSlaveLinkForMaster(link) for link in slave_links if self.check_slave_link(link)]) - set(master_links)
         to_slave_links = set([self._convertMasterLinkForSlave(link) for link in master_links if self.check_master_link(link)]) - set(slave_links)
 
-        self.master_links += to_master_links
-        self.slave_links += to_slave_links
+        with self._lock:
+            self.master_links += to_master_links
+            self.slave_links += to_slave_links
 
     def _convertSlaveLinkForMaster(self, slave_link):
         link_copy = copy.copy(slave_link)
@@ -118,7 +148,44 @@ class LinkSynchronizer(object):
     def check_master_link(self, link):
         return self.issue_binder.checkMasterId(link.source) and self.issue_binder.checkMasterId(link.target)
 
+    def _collect_bulk_links(self):
+        master_index = self._index_exported_links(self.masterExecutor.yt, self._bulk_master_ids)
+        slave_index = self._index_exported_links(self.slaveExecutor.yt, self._bulk_slave_ids)
+        to_master_links = dict([])
+        for key, link in list(slave_index.items()):
+            if self.check_slave_link(link):
+                converted = self._convertSlaveLinkForMaster(link)
+                converted_key = self._link_key(converted)
+                if converted_key not in master_index:
+                    to_master_links[converted_key] = converted
+        to_slave_links = dict([])
+        for key, link in list(master_index.items()):
+            if self.check_master_link(link):
+                converted = self._convertMasterLinkForSlave(link)
+                converted_key = self._link_key(converted)
+                if converted_key not in slave_index:
+                    to_slave_links[converted_key] = converted
+        self.master_links += list(to_master_links.values())
+        self.slave_links += list(to_slave_links.values())
+        self._bulk_master_ids = set([])
+        self._bulk_slave_ids = set([])
+
+    def _index_exported_links(self, yt, source_ids):
+        # only outward links of synced issues are compared, as collectLinksToSyncById does
+        index = dict([])
+        if not len(source_ids):
+            return index
+        for link in yt.iterExportedIssueLinks():
+            if link.source in source_ids:
+                index[self._link_key(link)] = link
+        return index
+
+    def _link_key(self, link):
+        return link.typeName, link.source, link.target
+
     def syncCollectedLinks(self):
+        if self.bulk_mode:
+            self._collect_bulk_links()
         self.slaveExecutor.importLinks(self.slave_links, self.issue_binder.getPermittedSlaveIds())
         self.masterExecutor.importLinks(self.master_links, self.issue_binder.getPermittedMasterIds())
         self.slave_links = []
@@ -142,13 +209,86 @@ class IssueBinder(object):
         self.m_to_s[master_id] = slave_id
 
     def getPermittedMasterIds(self):
-        return list(self.m_to_s.keys())
+        return self.m_to_s.keys()
 
     def getPermittedSlaveIds(self):
-        return list(self.s_to_m.keys())
+        return self.s_to_m.keys()
 
     def checkSlaveId(self, id):
         return id in self.s_to_m
 
     def checkMasterId(self, id):
-        return id in self.m_to_s
\ No newline at end of file
+        return id in self.m_to_s
+
+
+class SqliteIssueBinder(SqliteStore):
+    """
+    IssueBinder kept in a SQLite database file, indexed both by slave and master id. Bindings
+    are written as they are added and looked up on demand, so nothing has to be loaded on start.
+    """
+
+    _schema = (
+        'CREATE TABLE IF NOT EXISTS bindings (slave_id TEXT PRIMARY KEY, master_id TEXT NOT NULL)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS bindings_by_master ON bindings (master_id)',
+    )
+
+    def __init__(self, path, s_to_m=None):
+        SqliteStore.__init__(self, path)
+        if s_to_m:
+            self._executemany('INSERT OR REPLACE INTO bindings VALUES (?, ?)',
+                              [(str(s_id), str(m_id)) for s_id, m_id in list(s_to_m.items())])
+
+    def _lookup(self, column, key_column, key):
+        rows = self._execute('SELECT %s FROM bindings WHERE %s = ?' % (column, key_column), (str(key),))
+        if not len(rows):
+            raise KeyError(key)
+        return rows[0][0]
+
+    def slaveIssueIdToMasterIssueId(self, slave_issue_id):
+        return self._lookup('master_id', 'slave_id', slave_issue_id)
+
+    def masterIssueIdToSlaveIssueId(self, master_issue_id):
+        return self._lookup('slave_id', 'master_id', master_issue_id)
+
+    def addBinding(self, master_id, slave_id):
+        self._execute('INSERT OR REPLACE INTO bindings VALUES (?, ?)', (str(slave_id), str(master_id)))
+
+    def getPermittedMasterIds(self):
+        return _BoundIds(self, 'master_id')
+
+    def getPermittedSlaveIds(self):
+        return _BoundIds(self, 'slave_id')
+
+    def checkSlaveId(self, id):
+        return id in _BoundIds(self, 'slave_id')
+
+    def checkMasterId(self, id):
+        return id in _BoundIds(self, 'master_id')
+
+
+class _BoundIds(object):
+    """
+    Set-like view of the bound ids of one side, answered by index lookups.
+    """
+    _page = 1000
+
+    def __init__(self, binder, column):
+        self._binder = binder
+        self._column = column
+
+    def __contains__(self, id):
+        return len(self._binder._execute('SELECT 1 FROM bindings WHERE %s = ?' % self._column, (str(id),))) > 0
+
+    def __len__(self):
+        return self._binder._execute('SELECT COUNT(*) FROM bindings')[0][0]
+
+    def __iter__(self):
+        last = ''
+        while True:
+            rows = self._binder._execute('SELECT %s FROM bindings WHERE %s > ? ORDER BY %s LIMIT ?' %
+                                         (self._column, self._column, self._column), (last, self._page))
+            for row in rows:
+                yield row[0]
+            if len(rows) < self._page:
+                return
+            last = rows[-1][0]
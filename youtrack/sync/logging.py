@@ -1,12 +1,24 @@
+import json
+import os
+import queue
+import sys
+import threading
+import time
 from datetime import datetime
 
 LOGGING = True
 log_file_name_format = 'log_%d_%m_%Y'
 error_file_name_format = 'error_%d_%m_%Y'
+json_log_file_name_format = 'log_%d_%m_%Y.jsonl'
 MASTER_NAME = "Master"
 SLAVE_NAME = "Slave"
 UNDEFINED = "Undefined"
 
+# what JsonLinesLogger prints to stdout
+STDOUT_NOTHING = 0
+STDOUT_ERRORS = 1
+STDOUT_ALL = 2
+
 class Logger(object):
     def __init__(self, master, slave, master_root_login, slave_root_login):
         today = datetime.now()
@@ -46,4 +58,118 @@ class Logger(object):
     def _prepare_line(self, action_name, yt, message, run_as):
         yt_name = UNDEFINED if None else MASTER_NAME if yt == self.master else SLAVE_NAME
         user_login = (self.master_root_login if yt == self.master else self.slave_root_login) if run_as is None else run_as
-        return '[Sync, ' + action_name + ' in ' + yt_name + '] ' + message + ' on behalf of ' + user_login
\ No newline at end of file
+        return '[Sync, ' + action_name + ' in ' + yt_name + '] ' + message + ' on behalf of ' + user_login
+
+
+class JsonLinesLogger(Logger):
+    """
+    Logger writing one JSON record per line to a single file. Records are put to a queue and
+    written by a background thread, the file is rotated when it grows over max_bytes and
+    backup_count old files are kept as <path>.1, <path>.2 and so on.
+    finalize must be called to write the records left in the queue. Records that can't be
+    written are dropped, errors and the number of dropped records are reported to stderr.
+    """
+
+    def __init__(self, master, slave, master_root_login, slave_root_login, path=None,
+                 max_bytes=64 * 1024 * 1024, backup_count=5, stdout_level=STDOUT_ERRORS, queue_size=10000):
+        self.master = master
+        self.slave = slave
+        self.master_root_login = master_root_login
+        self.slave_root_login = slave_root_login
+        self.path = path if path is not None else datetime.now().strftime(json_log_file_name_format)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.stdout_level = stdout_level
+        self._queue = queue.Queue(queue_size)
+        self._file = open(self.path, 'ab')
+        self._size = os.path.getsize(self.path)
+        self.dropped = 0
+        self._writer = threading.Thread(target=self._write_records, name='sync-logger')
+        self._writer.daemon = True
+        self._writer.start()
+
+    def setStdoutLevel(self, level):
+        self.stdout_level = level
+
+    def logAction(self, action_name, yt, message, run_as=None):
+        if self.stdout_level >= STDOUT_ALL:
+            print(self._prepare_line(action_name, yt, message, run_as))
+        if LOGGING:
+            self._put(self._prepare_record('action', None, action_name, yt, message, run_as))
+
+    def logError(self, error, action_name, yt, message, run_as=None):
+        if self.stdout_level >= STDOUT_ERRORS:
+            print(self._prepare_line(action_name, yt, message, run_as))
+            print(error)
+        if LOGGING:
+            self._put(self._prepare_record('error', error, action_name, yt, message, run_as))
+
+    def finalize(self):
+        self._put(None)
+        self._writer.join()
+        self._file.close()
+        if self.dropped:
+            sys.stderr.write('%d records were not written to %s\n' % (self.dropped, self.path))
+
+    def _put(self, record):
+        # nothing would take records from a full queue once the writer is gone
+        if self._writer.is_alive():
+            self._queue.put(record)
+        elif record is not None:
+            self.dropped += 1
+
+    def _prepare_record(self, level, error, action_name, yt, message, run_as):
+        record = {'time': time.time(),
+                  'level': level,
+                  'action': action_name,
+                  'youtrack': MASTER_NAME if yt == self.master else SLAVE_NAME,
+                  'run_as': (self.master_root_login if yt == self.master else self.slave_root_login) if run_as is None else run_as,
+                  'message': message}
+        if error is not None:
+            record['error'] = str(error)
+        return record
+
+    def _write_records(self):
+        while True:
+            records = [self._queue.get()]
+            # write everything queued meanwhile at once
+            while not self._queue.empty() and len(records) < 1000:
+                records.append(self._queue.get())
+            finished = records[-1] is None
+            if finished:
+                records.pop()
+            try:
+                self._write(records)
+            except Exception as e:
+                sys.stderr.write('Failed to write sync log %s: %s\n' % (self.path, e))
+            if finished:
+                return
+
+    def _write(self, records):
+        if self._file.closed:
+            # the file is reopened after a failed rotation
+            self._file = open(self.path, 'ab')
+            self._size = os.path.getsize(self.path)
+        written = 0
+        try:
+            for record in records:
+                line = (json.dumps(record, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+                if self._size and self._size + len(line) > self.max_bytes:
+                    self._rotate()
+                self._file.write(line)
+                self._size += len(line)
+                written += 1
+            self._file.flush()
+        except Exception:
+            self.dropped += len(records) - written
+            raise
+
+    def _rotate(self):
+        self._file.close()
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                if os.path.exists('%s.%d' % (self.path, i)):
+                    os.replace('%s.%d' % (self.path, i), '%s.%d' % (self.path, i + 1))
+            os.replace(self.path, self.path + '.1')
+        self._file = open(self.path, 'wb')
+        self._size = 0
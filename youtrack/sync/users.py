@@ -1,7 +1,116 @@
+import threading
+import weakref
+
 import youtrack
 
 PROHIBITED = '/'
 
+_directories = weakref.WeakKeyDictionary()
+_directories_lock = threading.Lock()
+
+
+def get_user_directory(yt):
+    """
+    Returns the UserDirectory shared by everything that works with the connection yt.
+    """
+    with _directories_lock:
+        directory = _directories.get(yt)
+        if directory is None:
+            directory = UserDirectory(yt)
+            _directories[yt] = directory
+        return directory
+
+
+def sync_user(to_yt, from_yt, login, executor):
+    """
+    Imports user with login from from_yt to to_yt with executor, unless the user exists in to_yt.
+    """
+    to_directory = get_user_directory(to_yt)
+    # requests are made under the lock of the login only, other logins are synced meanwhile
+    with to_directory.login_lock(login):
+        if to_directory.exists(login):
+            return
+        user_to_import = get_user_directory(from_yt).get_user(login)
+        if user_to_import is not None and executor.executeUserImport(user_to_import):
+            to_directory.user_added(login)
+
+
+class UserDirectory(object):
+    """
+    Remembers which logins exist in a YouTrack and which do not, so every login is
+    requested at most once. After warm_up all users are known from a single listing
+    and logins missing from it are not requested at all.
+    """
+
+    def __init__(self, yt):
+        self.yt = yt
+        self.lock = threading.RLock()
+        self._users = dict([])
+        self._existing = set([])
+        self._missing = set([])
+        self._complete = False
+        self._login_locks = dict([])
+
+    def warm_up(self):
+        users = self.yt.getUsers()
+        with self.lock:
+            for user in users:
+                self._existing.add(user.login)
+            self._missing -= self._existing
+            self._complete = True
+
+    def exists(self, login):
+        with self.lock:
+            if self._normalize(login) in self._existing:
+                return True
+        return self.get_user(login) is not None
+
+    def get_user(self, login):
+        """
+        Returns User with login or None if there is no such user.
+        """
+        login = self._normalize(login)
+        with self.lock:
+            if login in self._users:
+                return self._users[login]
+            if login in self._missing or (self._complete and login not in self._existing):
+                return None
+        try:
+            user = self.yt.getUser(login)
+        except youtrack.YouTrackException:
+            user = None
+        with self.lock:
+            if user is None:
+                self._missing.add(login)
+                self._existing.discard(login)
+            else:
+                self._users[login] = user
+                self._existing.add(login)
+        return user
+
+    def login_lock(self, login):
+        """
+        Returns the lock of login, held while the user is checked and imported, so that
+        the same login is not imported twice at the same time.
+        """
+        login = self._normalize(login)
+        with self.lock:
+            if login not in self._login_locks:
+                self._login_locks[login] = threading.Lock()
+            return self._login_locks[login]
+
+    def user_added(self, login):
+        login = self._normalize(login)
+        with self.lock:
+            self._missing.discard(login)
+            self._existing.add(login)
+
+    def _normalize(self, login):
+        # getUser asks for guest instead of system users
+        if login.startswith('system_user'):
+            return 'guest'
+        return login
+
 def utf8encode(source):
     if isinstance(source, str):
         source = source.encode('utf-8')
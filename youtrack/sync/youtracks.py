@@ -1,12 +1,17 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from sync.executing import SafeCommandExecutor
 from sync.links import LinkSynchronizer
 
 from youtrack.sync.issues import AsymmetricIssueMerger
+from youtrack.sync.users import get_user_directory
 
 query_time_format = '%m-%dT%H:%M:%S'
 batch = 100
 tag = "sync"
 master_sync_field_name = 'Sync with'
+# merging updated issues needs only their ids
+updated_issue_fields = ('numberInProject', 'updated')
 empty_field_text = 'No sync with'
 
 def get_formatted_for_query(_datetime):
@@ -16,7 +21,7 @@ def get_advanced_query(query, _last_run, _current_run):
     return query + ' updated: ' + get_formatted_for_query(_last_run) + " .. " + get_formatted_for_query(_current_run)
 
 class YouTrackSynchronizer(object):
-    def __init__(self, master, slave, logger, issue_binder, project_id, fields_to_sync, query, last_run=None, current_run=None):
+    def __init__(self, master, slave, logger, issue_binder, project_id, fields_to_sync, query, last_run=None, current_run=None, workers=1, change_cache=None, comment_index=None):
         self.slave = None
         self.master = master
         self.slave = slave
@@ -28,13 +33,34 @@ class YouTrackSynchronizer(object):
         self.last_run = last_run
         self.current_run = current_run
         self.project_id = project_id
+        self.workers = workers
         self.link_synchronizer = LinkSynchronizer(self.master_executor, self.slave_executor, self.issue_binder)
-        self.issue_synchronizer = AsymmetricIssueMerger(master, slave, self.master_executor, self.slave_executor, self.issue_binder, self.link_synchronizer, fields_to_sync, last_run, current_run, project_id)
+        self.issue_synchronizer = AsymmetricIssueMerger(master, slave, self.master_executor, self.slave_executor, self.issue_binder, self.link_synchronizer, fields_to_sync, last_run, current_run, project_id, change_cache, comment_index)
 
     def setDebugMode(self, on):
         self.master_executor.setDebugMode(on)
         self.slave_executor.setDebugMode(on)
 
+    def setWorkers(self, workers):
+        """
+        Number of issues of a page processed concurrently. Pages and sync phases are still processed one after another.
+        """
+        self.workers = workers
+
+    def setBulkLinkSync(self, on):
+        """
+        Compares links of all synced issues at once instead of requesting them issue by issue.
+        """
+        self.link_synchronizer.setBulkMode(on)
+
+    def warmUpUsers(self):
+        """
+        Loads users of both YouTracks with a single listing each, so that existence of users
+        met during sync is not checked one login at a time.
+        """
+        get_user_directory(self.master).warm_up()
+        get_user_directory(self.slave).warm_up()
+
     def sync(self):
         #0. create if not existed and attach synchronization field
         self._create_and_attach_sync_field(self.slave, self.project_id, master_sync_field_name)
@@ -45,7 +71,7 @@ class YouTrackSynchronizer(object):
             log_header='[Sync, Importing new issues from slave to master]')
 
         #2. synchronize sync-issues in master which have no synchronized clone in slave
-        sync_set = set(self.issue_binder.s_to_m.values())
+        sync_set = self.issue_binder.getPermittedMasterIds()
         imported_master_ids_set = self._apply_to_issues(self._get_tagged_in_master,
             self._import_to_slave,
             excluded_ids=sync_set,
@@ -104,18 +130,46 @@ class YouTrackSynchronizer(object):
         print(log_header + ' started...')
         issues = issues_getter(start, batch)
         processed_issue_ids_set = set([])
-        while len(issues):
-            for issue in issues:
-                sync_id = str(issue.id)
-                if not (excluded_ids and sync_id in excluded_ids):
-                    action(issue)
-                    processed_issue_ids_set.add(sync_id)
-            print(log_header + ' processed ' + str(start + len(issues)) + ' issues')
-            start += batch
-            issues = issues_getter(start, batch)
+        executor = ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        try:
+            while len(issues):
+                if executor is None:
+                    for issue in issues:
+                        sync_id = str(issue.id)
+                        if not (excluded_ids and sync_id in excluded_ids):
+                            action(issue)
+                            processed_issue_ids_set.add(sync_id)
+                else:
+                    processed_issue_ids_set |= self._apply_concurrently(executor, issues, action, excluded_ids)
+                print(log_header + ' processed ' + str(start + len(issues)) + ' issues')
+                start += batch
+                issues = issues_getter(start, batch)
+        finally:
+            if executor is not None:
+                executor.shutdown()
         print(log_header + ' action applied to ' + str(len(processed_issue_ids_set)) + ' issues')
         return processed_issue_ids_set
 
+    def _apply_concurrently(self, executor, issues, action, excluded_ids):
+        # waits for the whole page, so the next page and the next phase start only after it
+        futures = dict([])
+        for issue in issues:
+            sync_id = str(issue.id)
+            if not (excluded_ids and sync_id in excluded_ids) and sync_id not in futures:
+                futures[sync_id] = executor.submit(action, issue)
+        processed_ids = set([])
+        error = None
+        for sync_id, future in list(futures.items()):
+            try:
+                future.result()
+                processed_ids.add(sync_id)
+            except Exception as e:
+                if error is None:
+                    error = e
+        if error is not None:
+            raise error
+        return processed_ids
+
     def _get_tagged_only_in_slave(self, start, batch):
         rq = self.query + ' ' + master_sync_field_name + ':  {' + empty_field_text + '}'
         return self.slave.getIssues(self.project_id, rq, start, batch)
@@ -126,11 +180,11 @@ class YouTrackSynchronizer(object):
 
     def _get_updated_in_slave_from_last_run(self, start, batch):
         rq = get_advanced_query(self.query, self.last_run, self.current_run)
-        return self.slave.getIssues(self.project_id, rq, start, batch)
+        return self.slave.getIssues(self.project_id, rq, start, batch, updated_issue_fields)
 
     def _get_updated_in_master_from_last_run(self, start, batch):
         rq = get_advanced_query(self.query, self.last_run, self.current_run)
-        return self.master.getIssues(self.project_id, rq, start, batch)
+        return self.master.getIssues(self.project_id, rq, start, batch, updated_issue_fields)
 
     def _mark_issues_as_sync(self, master_issue_number, master_issue_id, slave_issue_id):
         self.master_executor.executeCommand(master_issue_id, "tag " + tag)
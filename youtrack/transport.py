@@ -0,0 +1,249 @@
+"""
+HTTP transports of Connection.
+
+A transport sends requests and opens streams for downloads. Httplib2Transport, the default,
+uses httplib2 as the library always did. PooledTransport keeps persistent http.client
+connections in a pool, streams downloads and can be used when many requests are made from
+several threads.
+"""
+
+import gzip
+import http.client
+import ssl
+import threading
+import urllib.parse
+import urllib.request
+
+import httplib2
+
+import youtrack
+
+
+class Transport(object):
+    """
+    Interface of transports. Transports must be safe to use from several threads.
+    """
+
+    def request(self, url, method='GET', headers=None, body=None):
+        """
+        Sends a request and reads the whole response. body is bytes, str or a binary file
+        positioned at its start, a file is read while it is sent and needs Content-Length in headers.
+
+        Returns:
+            (response, content), response is a dict of lower-case header names to values with
+            status and reason attributes, the same as httplib2.Response, content is bytes.
+        """
+        raise NotImplementedError
+
+    def open(self, url, headers=None):
+        """
+        Sends a GET request and returns a file-like object reading the response body as it
+        comes. The object has headers, info() and close(). Errors are raised before return.
+        """
+        raise NotImplementedError
+
+
+class Httplib2Transport(Transport):
+    """
+    Requests go through httplib2, every thread gets its own httplib2.Http. Streams are opened
+    with urllib, because httplib2 always reads whole responses.
+    """
+
+    def __init__(self, proxy_info=None, timeout=None):
+        self.proxy_info = proxy_info
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @property
+    def http(self):
+        # httplib2.Http is not thread safe, so every thread gets its own one
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            if self.proxy_info is None:
+                http = httplib2.Http(disable_ssl_certificate_validation=True, timeout=self.timeout)
+            else:
+                http = httplib2.Http(disable_ssl_certificate_validation=True, timeout=self.timeout,
+                                     proxy_info=self.proxy_info)
+            self._local.http = http
+        return http
+
+    def request(self, url, method='GET', headers=None, body=None):
+        return self.http.request(url, method, headers=headers, body=body)
+
+    def open(self, url, headers=None):
+        request = urllib.request.Request(url, headers=headers or {})
+        if self.timeout is None:
+            return urllib.request.urlopen(request)
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+
+class Response(dict):
+    """
+    Headers and status of a response of http.client or urllib.error.HTTPError in the form
+    of httplib2.Response.
+    """
+
+    def __init__(self, response):
+        dict.__init__(self)
+        for (name, value) in list(response.headers.items()):
+            name = name.lower()
+            # repeated headers are joined the way httplib2 does it
+            self[name] = self[name] + ', ' + value if name in self else value
+        self.status = response.status
+        self.reason = response.reason
+
+
+class PooledTransport(Transport):
+    """
+    Keeps up to max_connections idle connections to every host and reuses them for later
+    requests. Responses are requested gzipped and decompressed, redirects of GET requests are
+    followed. Proxies are not supported. Certificates are not verified unless verify_ssl is
+    set, the same as with Httplib2Transport.
+    """
+
+    _redirects = (301, 302, 303, 307, 308)
+
+    def __init__(self, max_connections=10, timeout=60, verify_ssl=False, max_redirects=5):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self._ssl_context = ssl.create_default_context() if verify_ssl else ssl._create_unverified_context()
+        self._pools = dict([])
+        self._lock = threading.Lock()
+
+    def _split(self, url):
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        return (parts.scheme, parts.netloc), path
+
+    def _acquire(self, key):
+        """
+        Returns a connection to the host of key and whether it has been used before.
+        """
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool:
+                return pool.pop(), True
+        scheme, netloc = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout, context=self._ssl_context), False
+        return http.client.HTTPConnection(netloc, timeout=self.timeout), False
+
+    def _release(self, key, connection, response):
+        if response.will_close:
+            connection.close()
+            return
+        with self._lock:
+            pool = self._pools.setdefault(key, [])
+            if len(pool) < self.max_connections:
+                pool.append(connection)
+                return
+        connection.close()
+
+    def _send(self, key, path, method, headers, body):
+        # a connection taken from the pool may have been closed by the server meanwhile,
+        # then the request is repeated once on a new connection
+        while True:
+            connection, reused = self._acquire(key)
+            if hasattr(body, 'seek'):
+                body.seek(0)
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                return connection, connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if not reused:
+                    raise
+            except Exception:
+                connection.close()
+                raise
+
+    def request(self, url, method='GET', headers=None, body=None):
+        headers = dict(headers or {})
+        headers.setdefault('Accept-Encoding', 'gzip')
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if body is not None and not hasattr(body, 'read'):
+            headers['Content-Length'] = str(len(body))
+        for redirect in range(self.max_redirects + 1):
+            key, path = self._split(url)
+            connection, response = self._send(key, path, method, headers, body)
+            try:
+                content = response.read()
+            except Exception:
+                connection.close()
+                raise
+            self._release(key, connection, response)
+            result = Response(response)
+            if method == 'GET' and response.status in self._redirects and 'location' in result:
+                url = urllib.parse.urljoin(url, result['location'])
+                continue
+            break
+        if result.get('content-encoding', '').lower() == 'gzip':
+            content = gzip.decompress(content)
+            # the same keys as httplib2 sets for decompressed responses
+            result['-content-encoding'] = result.pop('content-encoding')
+            result['content-length'] = str(len(content))
+        return result, content
+
+    def open(self, url, headers=None):
+        for redirect in range(self.max_redirects + 1):
+            key, path = self._split(url)
+            connection, response = self._send(key, path, 'GET', dict(headers or {}), None)
+            if response.status in self._redirects and response.getheader('location'):
+                response.read()
+                self._release(key, connection, response)
+                url = urllib.parse.urljoin(url, response.getheader('location'))
+                continue
+            if response.status >= 300:
+                content = response.read()
+                self._release(key, connection, response)
+                raise youtrack.YouTrackException(url, Response(response), content)
+            return PooledStream(self, key, connection, response, url)
+        raise youtrack.YouTrackException(url, Response(response), b'')
+
+
+class PooledStream(object):
+    """
+    Body of a response opened by PooledTransport. The connection goes back to the pool
+    when the body has been read to the end, closing the stream earlier drops the connection.
+    """
+
+    def __init__(self, transport, key, connection, response, url):
+        self._transport = transport
+        self._key = key
+        self._connection = connection
+        self._response = response
+        self._url = url
+        self.headers = response.msg
+
+    def info(self):
+        return self.headers
+
+    def geturl(self):
+        return self._url
+
+    def getcode(self):
+        return self._response.status
+
+    def read(self, size=-1):
+        if self._connection is None:
+            return b''
+        data = self._response.read() if size is None or size < 0 else self._response.read(size)
+        if self._response.isclosed():
+            self._transport._release(self._key, self._connection, self._response)
+            self._connection = None
+        return data
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,28 @@
+"""
+Helpers for requesting issues updated since a given time, used by the mirror and the watcher.
+"""
+
+import time
+from datetime import datetime
+
+query_time_format = '%Y-%m-%dT%H:%M:%S'
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_updated_query(since, overlap):
+    """
+    Returns a query for issues updated after since (in milliseconds).
+
+    The window starts overlap seconds before since, because query times have a precision of
+    a second and are interpreted by the server. It ends a day ahead, so that clocks of the
+    server and the client need not be in sync.
+    """
+    window_start = datetime.fromtimestamp(since / 1000.0 - overlap)
+    window_end = datetime.fromtimestamp(time.time() + 24 * 60 * 60)
+    return 'updated: ' + window_start.strftime(query_time_format) + ' .. ' + window_end.strftime(query_time_format)
@@ -0,0 +1,128 @@
+"""
+Polls YouTrack for updated issues and delivers their new changes as events.
+"""
+
+import sys
+import threading
+import time
+
+from youtrack.updatesHelper import get_updated_query, to_int
+
+
+class IssueWatcher(object):
+    """
+    Watches issues matching query (of project_id, when given) for changes. Every poll requests
+    issues updated since the previous one, and for the issues updated after the change that
+    was delivered last only the newer changes are parsed. Each change is delivered once,
+    to every callback as callback(issue_id, change) and to the queue as (issue_id, change).
+
+    The poll interval starts at min_interval, is doubled after every poll without events up to
+    max_interval, and drops back to min_interval as soon as something changes.
+    """
+
+    def __init__(self, connection, project_id=None, query='', queue=None, min_interval=10, max_interval=300,
+                 batch=100, overlap=60, since=None):
+        """
+        Args:
+            overlap: Seconds the requested window starts before the previous poll, see
+                get_updated_query.
+            since: Time in milliseconds changes are watched from, the current time by default.
+        """
+        self.connection = connection
+        self.project_id = project_id
+        self.query = query
+        self.queue = queue
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.batch = batch
+        self.overlap = overlap
+        self.since = since if since is not None else int(time.time() * 1000)
+        self._watched_from = self.since
+        self._callbacks = []
+        self._delivered = dict([])
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_callback(self, callback):
+        self._callbacks.append(callback)
+
+    def poll(self):
+        """
+        Requests updated issues once and delivers their new changes.
+
+        Returns:
+            Number of delivered changes.
+        """
+        poll_started = int(time.time() * 1000)
+        window_start = self.since - self.overlap * 1000
+        query = (self.query + ' ' + get_updated_query(self.since, self.overlap)).strip()
+        delivered = 0
+        start = 0
+        while True:
+            issues = self.connection.getIssues(self.project_id, query, start, self.batch)
+            if not len(issues):
+                break
+            for issue in issues:
+                delivered += self._process_issue(issue, max(window_start, self._watched_from))
+            start += self.batch
+        self.since = poll_started
+        # issues not updated within the overlap will not be returned by next polls
+        for issue_id, updated in list(self._delivered.items()):
+            if updated < window_start:
+                del self._delivered[issue_id]
+        self.interval = self.min_interval if delivered else min(self.interval * 2, self.max_interval)
+        return delivered
+
+    def _process_issue(self, issue, window_start):
+        issue_id = str(issue.id)
+        updated = to_int(getattr(issue, 'updated', None))
+        after = self._delivered.get(issue_id, window_start)
+        if updated is not None and updated <= after:
+            return 0
+        changes = self.connection.get_changes_for_issue(issue_id, after=after)
+        for change in changes:
+            self._deliver(issue_id, change)
+        if len(changes):
+            self._delivered[issue_id] = max(change.updated for change in changes)
+        elif updated is not None:
+            self._delivered[issue_id] = updated
+        return len(changes)
+
+    def _deliver(self, issue_id, change):
+        for callback in self._callbacks:
+            # a failing callback must not keep the change from the others
+            try:
+                callback(issue_id, change)
+            except Exception as e:
+                sys.stderr.write('Callback failed for a change of issue [%s]: %s\n' % (issue_id, e))
+        if self.queue is not None:
+            self.queue.put((issue_id, change))
+
+    def run(self):
+        """
+        Polls until stop is called. Errors of a poll are reported and the poll is repeated later.
+        """
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                # network and parsing errors as well, the thread must outlive any of them
+                sys.stderr.write('Failed to poll for updated issues: %r\n' % e)
+                self.interval = min(self.interval * 2, self.max_interval)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """
+        Starts polling in a background thread.
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name='issue-watcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,8 +1,16 @@
 import itertools
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from xml.dom import minidom
+from xml.parsers.expat import ExpatError
 
 import youtrack
 from youtrack import YouTrackException, Issue
-from youtrack.importHelper import create_custom_field
+from youtrack.importHelper import create_custom_field, get_tag_import_levels
+from youtrack.importJournal import GLOBAL, ImportJournal
+from youtrack.importPipeline import Pipeline, PipelineStage
+from youtrack.importSchema import CustomFieldTypes, ProjectSchema
+from youtrack.importUsers import UserProvisioner
 
 __author__ = 'user'
 
@@ -12,24 +20,109 @@ POLICY = 'bundle_policy'
 AUTO_ATTACHED = 'auto_attached'
 NUMBER_IN_PROJECT = 'numberInProject'
 
+ISSUES_BATCH_SIZE = 100
+
+CONVERT_STAGE = 'convert'
+UPLOAD_STAGE = 'upload'
+ATTACHMENTS_STAGE = 'attachments'
+
+AUTO_ATTACHED_FIELDS_DONE = 'auto_attached_fields'
+CUSTOM_FIELDS_DONE = 'custom_fields'
+PROJECT_DONE = 'project'
+PROJECT_FIELDS_DONE = 'project_fields'
+FIELD_VALUES_DONE = 'field_values'
+ISSUES_DONE = 'issues'
+TAGS_DONE = 'tags'
+LINKS_DONE = 'links'
+
+
+def _get_imported_numbers(result):
+    """
+    Returns numbers of items of an issues import result with imported="true".
+    """
+    if not result:
+        return set([])
+    try:
+        items = minidom.parseString(result).getElementsByTagName('item')
+    except ExpatError:
+        return set([])
+    return set([item.getAttribute('id') for item in items if item.getAttribute('imported').lower() == 'true'])
+
+
+def _get_tag_command(tag):
+    # tags with spaces are put in braces, otherwise only the first word is taken for the tag
+    return 'tag ' + ('{%s}' % tag if ' ' in tag else tag)
+
 
 class YouTrackImporter(object):
-    def __init__(self, source, target, import_config):
+    def __init__(self, source, target, import_config, pipeline_workers=None, pipeline_queue_size=2,
+                 users_batch_size=100, journal=None, stream_xml=False):
+        """
+        Args:
+            source: Connection to the tracker issues are imported from.
+            target: Connection to YouTrack issues are imported to.
+            import_config: YouTrackImportConfig instance.
+            pipeline_workers: If None, issues are read, converted, uploaded and their attachments
+                imported one batch after another. Otherwise issues are imported by a pipeline and
+                this dict maps stage name (CONVERT_STAGE, UPLOAD_STAGE, ATTACHMENTS_STAGE) to the
+                number of worker threads of the stage, missing stages get one worker.
+                Issues are read from source in the calling thread.
+            pipeline_queue_size: Max number of issue batches waiting between two pipeline stages.
+            users_batch_size: Number of new users collected from issues before they are imported.
+            journal: ImportJournal to record the progress in. Pass a journal kept in a file to be able to
+                resume an interrupted import: finished stages, imported issues, attachments, link batches
+                and users are skipped on restart. If None, progress is recorded in memory only.
+            stream_xml: If True, converted issues are written straight into the import request body
+                by _to_yt_record instead of being built as Issue objects by _to_yt_issue.
+        """
         self._source = source
         self._target = target
         self._import_config = import_config
+        self._pipeline_workers = pipeline_workers
+        self._pipeline_queue_size = pipeline_queue_size
+        self._field_types = CustomFieldTypes(target)
+        self._schemas = dict([])
+        self._schemas_lock = threading.Lock()
+        self._plans = dict([])
+        self._stream_xml = stream_xml
+        self._bad_fields = dict([])
+        self._journal = journal if journal is not None else ImportJournal()
+        self._users = UserProvisioner(target, users_batch_size, self._journal)
 
     def do_import(self, projects, new_projects_owner_login='root'):
         project_ids = list(projects.keys())
-        self._create_auto_attached_fields()
-        self._create_custom_fields(project_ids)
+        self._import_shared_fields(project_ids)
         for project_id, project_name in list(projects.items()):
-            self._create_project(project_id, project_name, new_projects_owner_login)
-            self._attach_fields_to_project(project_id)
-            self._add_value_to_fields_in_project(project_id)
-            self._import_issues(project_id)
-        self._import_tags(project_ids)
-        self._import_issue_links(project_ids)
+            self._import_project(project_id, project_name, new_projects_owner_login)
+        self._import_cross_project_data(project_ids)
+
+    def _import_shared_fields(self, project_ids):
+        self._run_stage(GLOBAL, AUTO_ATTACHED_FIELDS_DONE, self._create_auto_attached_fields)
+        new_project_ids = [project_id for project_id in project_ids
+                           if not self._journal.is_stage_done(project_id, CUSTOM_FIELDS_DONE)]
+        if len(new_project_ids):
+            self._create_custom_fields(new_project_ids)
+            for project_id in new_project_ids:
+                self._journal.stage_done(project_id, CUSTOM_FIELDS_DONE)
+
+    def _import_project(self, project_id, project_name, new_projects_owner_login):
+        self._run_stage(project_id, PROJECT_DONE,
+                        self._create_project, project_id, project_name, new_projects_owner_login)
+        self._run_stage(project_id, PROJECT_FIELDS_DONE, self._attach_fields_to_project, project_id)
+        self._run_stage(project_id, FIELD_VALUES_DONE, self._add_value_to_fields_in_project, project_id)
+        self._run_stage(project_id, ISSUES_DONE, self._import_issues, project_id)
+        self._users.flush()
+
+    def _import_cross_project_data(self, project_ids):
+        self._run_stage(GLOBAL, TAGS_DONE, self._import_tags, project_ids)
+        for project_id in project_ids:
+            self._run_stage(project_id, LINKS_DONE, self._import_issue_links, [project_id])
+
+    def _run_stage(self, project_id, stage, function, *args):
+        if self._journal.is_stage_done(project_id, stage):
+            return
+        function(*args)
+        self._journal.stage_done(project_id, stage)
 
     def _create_auto_attached_fields(self):
         predefined_fields = self._import_config.get_predefined_fields()
@@ -40,6 +133,7 @@ class YouTrackImporter(object):
         if field_name in youtrack.EXISTING_FIELDS:
             return
         create_custom_field(self._target, field_type, field_name, auto_attached, bundle_policy=attach_bundle_policy)
+        self._field_types.field_created(field_name, field_type)
 
     def _create_custom_fields(self, project_ids):
         custom_fields = self._get_custom_fields_for_projects(project_ids)
@@ -57,78 +151,144 @@ class YouTrackImporter(object):
             self._target.createProjectDetailed(project_id, project_name, '', project_lead_login)
 
     def _attach_fields_to_project(self, project_id):
+        schema = self._get_schema(project_id)
         for yt_field in self._get_custom_fields_for_projects([project_id]):
             field_name = yt_field[NAME]
             try:
                 self._target.createProjectCustomFieldDetailed(project_id, field_name, 'No ' + field_name)
+                schema.field_attached(field_name)
             except YouTrackException:
                 pass
                 # print(u'Field [%s] is already attached' % field_name)
 
+    def _get_schema(self, project_id):
+        with self._schemas_lock:
+            if project_id not in self._schemas:
+                self._schemas[project_id] = ProjectSchema(self._target, project_id)
+            return self._schemas[project_id]
+
     def _import_issues(self, project_id):
-        limit = 100
-        all_issues = self._get_issues(project_id)
+        if self._pipeline_workers is not None:
+            self._import_issues_pipelined(project_id)
+            return
+        for issues in self._read_issue_batches(project_id):
+            imported = self._upload_issues(project_id, self._convert_issues(project_id, issues))
+            self._import_issues_attachments(project_id, issues, imported)
+
+    def _import_issues_pipelined(self, project_id):
+        def convert(issues):
+            return issues, self._convert_issues(project_id, issues)
+
+        def upload(batch):
+            issues, yt_issues = batch
+            return issues, self._upload_issues(project_id, yt_issues)
+
+        def import_attachments(batch):
+            issues, imported = batch
+            self._import_issues_attachments(project_id, issues, imported)
+
+        workers = self._pipeline_workers
+        pipeline = Pipeline([PipelineStage(CONVERT_STAGE, convert, workers.get(CONVERT_STAGE, 1)),
+                             PipelineStage(UPLOAD_STAGE, upload, workers.get(UPLOAD_STAGE, 1)),
+                             PipelineStage(ATTACHMENTS_STAGE, import_attachments, workers.get(ATTACHMENTS_STAGE, 1))],
+                            self._pipeline_queue_size)
+        pipeline.run(self._read_issue_batches(project_id))
+
+    def _read_issue_batches(self, project_id):
+        imported = self._journal.get_imported_issues(project_id)
+        all_issues = (issue for issue in self._get_issues(project_id) if self._get_issue_id(issue) not in imported)
         while True:
-            issues = list(itertools.islice(all_issues, None, limit))
+            issues = list(itertools.islice(all_issues, None, ISSUES_BATCH_SIZE))
             if not len(issues):
                 break
-            self._target.importIssues(project_id, project_id + ' assignees',
-                [self._to_yt_issue(issue, project_id) for issue in issues])
-            for issue in issues:
-                issue_id = self._get_issue_id(issue)
-                issue_attachments = self._get_attachments(issue)
-                yt_issue_id = '%s-%s' % (project_id, issue_id)
-                self._import_attachments(yt_issue_id, issue_attachments)
+            yield issues
+
+    def _convert_issues(self, project_id, issues):
+        if not self._stream_xml:
+            return [self._to_yt_issue(issue, project_id) for issue in issues]
+        with self._schemas_lock:
+            if project_id not in self._bad_fields:
+                self._bad_fields[project_id] = self._target.getIssueImportBadFields(project_id)
+        writer = self._target.createIssuesXmlWriter(project_id, self._bad_fields[project_id])
+        for issue in issues:
+            writer.add_issue(*self._to_yt_record(issue, project_id))
+        return writer
+
+    def _upload_issues(self, project_id, yt_issues):
+        """
+        Returns numbers of issues the server reported as imported.
+        """
+        self._users.flush()
+        if self._stream_xml:
+            result = self._target.importIssuesFromWriter(project_id, project_id + ' assignees', yt_issues)
+        else:
+            result = self._target.importIssues(project_id, project_id + ' assignees', yt_issues)
+        return _get_imported_numbers(result)
+
+    def _import_issues_attachments(self, project_id, issues, imported):
+        # an issue is journaled only when its attachments are imported as well, so that
+        # an issue interrupted in between is uploaded again on resume and gets its attachments
+        done = []
+        for issue in issues:
+            issue_id = self._get_issue_id(issue)
+            if issue_id not in imported:
+                continue
+            issue_attachments = self._get_attachments(issue)
+            yt_issue_id = '%s-%s' % (project_id, issue_id)
+            for attach in issue_attachments:
+                if self._journal.is_attachment_imported(yt_issue_id, attach.name):
+                    continue
+                self._import_attachments(yt_issue_id, [attach])
+                self._journal.attachment_imported(yt_issue_id, attach.name)
+            done.append(issue_id)
+        self._journal.issues_imported(project_id, done)
 
     def _import_tags(self, project_ids):
-        limit = 100
-        existing_tags = set([])
-        for project_id in project_ids:
-            all_tags = self._get_issue_tags(project_id)
-            while True:
-                l = list(itertools.islice(all_tags, None, limit))
-                if not len(l):
-                    break
-                issue_tags = list(zip(*l))[1]
-                existing_tags |= set([item for tags in issue_tags for item in tags])
-        self._do_import_tags(project_ids, existing_tags)
-
-    def _is_prefix_of_any_other_tag(self, tag, other_tags):
-        for t in other_tags:
-            if t.startswith(tag) and (t != tag):
-                return True
-        return False
-
-
-    def _do_import_tags(self, project_ids, collected_tags):
-        tags_to_import_now = set([])
-        tags_to_import_after = set([])
-        for tag in collected_tags:
-            if self._is_prefix_of_any_other_tag(tag, collected_tags):
-                tags_to_import_after.add(tag)
-            else:
-                tags_to_import_now.add(tag)
+        issue_tags = []
+        collected_tags = set([])
         for project_id in project_ids:
             for (issue_id, tags) in self._get_issue_tags(project_id):
-                yt_issue_id = '%s-%s' % (project_id, issue_id)
-                for tag in tags:
-                    if tag in tags_to_import_now:
-                        try:
-                            self._target.executeCommand(yt_issue_id, 'tag ' + tag)
-                        except YouTrackException:
-                            print(('Failed to import tag for issue [%s]' % yt_issue_id))
-        if len(tags_to_import_after):
-            self._do_import_tags(project_ids, tags_to_import_after)
+                issue_tags.append(('%s-%s' % (project_id, issue_id), tags))
+                collected_tags.update(tags)
+        levels = get_tag_import_levels(collected_tags)
+        # tag that is a prefix of another tag is applied only after that tag has been created
+        rounds = dict([])
+        for (yt_issue_id, tags) in issue_tags:
+            issue_rounds = dict([])
+            for tag in tags:
+                issue_rounds.setdefault(levels[tag], []).append(tag)
+            for level, level_tags in list(issue_rounds.items()):
+                rounds.setdefault(level, []).append((yt_issue_id, level_tags))
+        for level in sorted(rounds.keys()):
+            for (yt_issue_id, tags) in rounds[level]:
+                self._apply_tags(yt_issue_id, tags)
+
+    def _apply_tags(self, yt_issue_id, tags):
+        if len(tags) > 1:
+            command = ' '.join(_get_tag_command(tag) for tag in tags)
+            try:
+                self._target.executeCommand(yt_issue_id, command)
+                return
+            except YouTrackException:
+                pass
+        for tag in tags:
+            try:
+                self._target.executeCommand(yt_issue_id, _get_tag_command(tag))
+            except YouTrackException:
+                print(('Failed to import tag for issue [%s]' % yt_issue_id))
 
     def _import_issue_links(self, project_ids):
         limit = 100
         for project_id in project_ids:
+            imported = self._journal.get_imported_link_batches(project_id)
             after = 0
             while True:
                 links = self._get_issue_links(project_id, after, limit)
                 if not len(links):
                     break
-                self._target.importLinks(links)
+                if after not in imported:
+                    self._target.importLinks(links)
+                    self._journal.link_batch_imported(project_id, after)
                 after += limit
 
     def process_field(self, key, project_id, result, value):
@@ -166,50 +326,59 @@ class YouTrackImporter(object):
         result = Issue()
         result.comments = [self._to_yt_comment(comment) for comment in self._get_comments(issue)]
         result.numberInProject = self._get_issue_id(issue)
-        for (key, value) in list(issue.items()):
-            self.process_field(key, project_id, result, value)
+        self._get_plan(project_id).convert(issue, result)
         return result
 
+    def _to_yt_record(self, issue, project_id):
+        """
+        Returns issue number, dict of converted fields and list of converted comments.
+        """
+        fields = dict([])
+        self._get_plan(project_id).convert(issue, fields)
+        comments = [self._to_yt_comment(comment) for comment in self._get_comments(issue)]
+        return self._get_issue_id(issue), fields, comments
+
+    def _get_plan(self, project_id):
+        with self._schemas_lock:
+            if project_id not in self._plans:
+                self._plans[project_id] = ImportPlan(self, project_id)
+            return self._plans[project_id]
+
     def _get_field_name(self, field_name, project_id):
         field_name = self._import_config.get_field_name(field_name)
         if field_name in youtrack.EXISTING_FIELDS:
             return field_name
-        try:
-            self._target.getProjectCustomField(project_id, field_name)
+        if self._get_schema(project_id).has_field(field_name):
             return field_name
-        except YouTrackException:
-            return None
+        return None
 
     def _get_field_type(self, field_name):
         if field_name in youtrack.EXISTING_FIELD_TYPES:
             return youtrack.EXISTING_FIELD_TYPES[field_name]
-        try:
-            return self._target.getCustomField(field_name).type
-        except YouTrackException:
-            return None
+        return self._field_types.get_type(field_name)
 
     def _import_user(self, user):
-        self._target.importUsers([user])
-        for group in user.getGroups():
-            try:
-                self._target.createGroup(group)
-            except YouTrackException:
-                pass
-            self._target.setUserGroup(user.login, group.name)
+        self._users.add(user)
 
     def _add_value_to_field(self, project_id, field_name, field_type, value):
-        if (field_type is not None) and field_type.startswith('user'):
+        is_user = (field_type is not None) and field_type.startswith('user')
+        if is_user:
             self._import_user(value)
             value = value.login
         if field_name in youtrack.EXISTING_FIELDS:
             return
-        custom_field = self._target.getProjectCustomField(project_id, field_name)
-        if hasattr(custom_field, 'bundle'):
-            bundle = self._target.getBundle(field_type, custom_field.bundle)
-            try:
-                self._target.addValueToBundle(bundle, value)
-            except YouTrackException:
-                pass
+        schema = self._get_schema(project_id)
+        if is_user and (schema.get_bundle(field_name) is not None) and not schema.has_value(field_name, value):
+            # user must exist before it is added to a bundle, so it is added after its batch is imported
+            self._users.when_imported(value, lambda: self._add_bundle_value(schema, field_name, value))
+            return
+        self._add_bundle_value(schema, field_name, value)
+
+    def _add_bundle_value(self, schema, field_name, value):
+        try:
+            schema.add_value(field_name, value)
+        except YouTrackException:
+            pass
 
     def get_field_value(self, field_name, field_type, value):
         if value is None:
@@ -230,18 +399,19 @@ class YouTrackImporter(object):
         return date
 
     def _add_value_to_fields_in_project(self, project_id):
+        schema = self._get_schema(project_id)
         for field in self._get_fields_with_values(project_id):
             field_name = self._get_field_name(field[NAME], project_id)
-            pcf = self._target.getProjectCustomField(project_id, field_name)
-            if hasattr(pcf, 'bundle'):
-                field_type = pcf.type[0:-3]
-                bundle = self._target.getBundle(field_type, pcf.bundle)
+            bundle = schema.get_bundle(field_name)
+            if bundle is not None:
+                field_type = schema.get_field(field_name).type[0:-3]
                 yt_values = [v for v in [field['converter'](value, bundle,
                     lambda name, value_name: self._import_config.get_field_value(name, field_type, value_name)) for
                                          value in
                                          field['values']] if len(v)]
-                for value in yt_values:
-                    self._target.addValueToBundle(bundle, value)
+                for result in schema.add_values(field_name, yt_values):
+                    if result.error is not None:
+                        raise result.error
 
     def _get_issue_id(self, issue):
         return str(issue[self._import_config.get_key_for_field_name(NUMBER_IN_PROJECT)])
@@ -278,9 +448,100 @@ class YouTrackImporter(object):
         raise NotImplementedError
 
 
+class ImportPlan(object):
+    """
+    Conversion of source issues to YouTrack issues compiled for one project. Name mapping,
+    field type, value mapping and value conversion of a source key are resolved once, when
+    the key is met for the first time, into a converter closure, so converting an issue is
+    a loop over its values calling precompiled converters.
+    """
+
+    def __init__(self, importer, project_id):
+        self._importer = importer
+        self._project_id = project_id
+        self._converters = dict([])
+        self._lock = threading.Lock()
+
+    def convert(self, issue, result):
+        converters = self._converters
+        for (key, value) in list(issue.items()):
+            # we do not need fields with empty values
+            if value is None:
+                continue
+            if isinstance(value, (list, str)) and not len(value):
+                continue
+            if key in converters:
+                converter = converters[key]
+            else:
+                converter = self._compile(key)
+            if converter is not None:
+                converter(value, result)
+
+    def _compile(self, key):
+        with self._lock:
+            if key not in self._converters:
+                self._converters[key] = self._create_converter(key)
+            return self._converters[key]
+
+    def _create_converter(self, key):
+        importer = self._importer
+        project_id = self._project_id
+        importer_class = type(importer)
+        if importer_class.process_field is not YouTrackImporter.process_field:
+            return lambda value, result: importer.process_field(key, project_id, result, value)
+
+        field_name = importer._get_field_name(key, project_id)
+        if field_name is None or field_name == NUMBER_IN_PROJECT:
+            return None
+        field_type = importer._get_field_type(field_name)
+        if (field_type is None) and (field_name not in youtrack.EXISTING_FIELDS):
+            return None
+        is_user = (field_type is not None) and field_type.startswith('user')
+        convert_value = self._create_value_converter(field_name, field_type)
+        add_value = importer._add_value_to_field
+
+        def convert(value, result):
+            if isinstance(value, list):
+                value = [convert_value(v) for v in value]
+                for v in value:
+                    add_value(project_id, field_name, field_type, v)
+                if is_user:
+                    value = [v.login for v in value]
+            else:
+                value = convert_value(value)
+                add_value(project_id, field_name, field_type, value)
+                value = str(value.login) if is_user else str(value)
+            result[field_name] = value
+
+        return convert
+
+    def _create_value_converter(self, field_name, field_type):
+        importer = self._importer
+        if type(importer).get_field_value is not YouTrackImporter.get_field_value:
+            return lambda value: importer.get_field_value(field_name, field_type, value)
+        if field_type.startswith('user'):
+            return importer._to_yt_user
+        if field_type.lower() == 'date':
+            return importer.to_unix_date
+        values_map = importer._import_config.get_value_mapping(field_name)
+
+        def map_value(value):
+            if value is None:
+                return None
+            if isinstance(value, str):
+                return values_map.get(value, value)
+            if isinstance(value, int):
+                return values_map.get(value, str(value))
+
+        return map_value
+
+
 class YouTrackImportConfig(object):
     def __init__(self, name_mapping, type_mapping, value_mapping=None, link_type_mapping=None):
         self._name_mapping = name_mapping
+        self._key_for_field_name = dict([])
+        for (key, value) in list(name_mapping.items()):
+            self._key_for_field_name.setdefault(value, key)
         self._type_mapping = type_mapping
         self._value_mapping = value_mapping if value_mapping is not None else {}
         self._link_type_mapping = link_type_mapping if link_type_mapping is not None else {}
@@ -301,10 +562,38 @@ class YouTrackImportConfig(object):
         return self._link_type_mapping[type] if type in self._link_type_mapping else type
 
     def get_key_for_field_name(self, field_name):
-        for (key, value) in list(self._name_mapping.items()):
-            if value == field_name:
-                return key
-        return field_name
+        return self._key_for_field_name.get(field_name, field_name)
 
     def get_value_mapping(self, field_name):
         return self._value_mapping[field_name] if field_name in self._value_mapping else {}
+
+
+def import_projects_in_parallel(importer_factory, projects, new_projects_owner_login='root', processes=None):
+    """
+    Does the same as YouTrackImporter.do_import, but imports projects in parallel worker processes.
+    Custom field prototypes are created once before projects are imported, tags and links are
+    imported after all projects, because they can point to issues of other projects.
+
+    Args:
+        importer_factory: Callable without arguments that creates a YouTrackImporter with its own
+            connections. It is called in every worker process, so it has to be picklable, e.g. a module
+            level function or a functools.partial of one. If importers use an ImportJournal, every call
+            should open the same journal file.
+        projects: Dict from project id to project name.
+        new_projects_owner_login: Login of the lead of created projects.
+        processes: Max number of worker processes, by default the number of CPUs.
+    """
+    importer = importer_factory()
+    project_ids = list(projects.keys())
+    importer._import_shared_fields(project_ids)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [executor.submit(_import_project_in_process, importer_factory, project_id, project_name,
+                                   new_projects_owner_login)
+                   for project_id, project_name in list(projects.items())]
+        for future in futures:
+            future.result()
+    importer._import_cross_project_data(project_ids)
+
+
+def _import_project_in_process(importer_factory, project_id, project_name, new_projects_owner_login):
+    importer_factory()._import_project(project_id, project_name, new_projects_owner_login)